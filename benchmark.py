@@ -0,0 +1,350 @@
+import argparse
+import itertools
+import json
+import math
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from os import path
+from time import perf_counter
+
+import requests
+
+from discogs_stub import GENRES, STYLES, StubDiscogsServer, make_title
+from playlist import Playlist
+from simple_discogs import SimpleDiscogs
+from tape_solver import fit_tape
+
+
+def time_calls(function, calls):
+    timings = []
+    for _ in range(calls):
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+    timings.sort()
+    return {'calls': calls,
+            'min_ms': round(timings[0] * 1000, 4),
+            'mean_ms': round(sum(timings) / len(timings) * 1000, 4),
+            'p50_ms': round(timings[len(timings) // 2] * 1000, 4),
+            'p95_ms': round(timings[int(len(timings) * 0.95)] * 1000, 4)}
+
+
+def bench_connections(release_count=200, calls=500, handshake_latency=0.002):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, \
+            StubDiscogsServer(release_count, rate_limit=10 ** 9, handshake_latency=handshake_latency) as stub:
+        with SimpleDiscogs('bench', 'token', database_location=directory, api_url=stub.url) as sd:
+            release_ids = itertools.cycle([release['id'] for release in stub.collection])
+            select_statement = 'SELECT ' + ','.join(sd.release_fields) + ' FROM RELEASES WHERE RELEASE_ID=?'
+
+            def per_call_connection():
+                conn = sqlite3.connect(sd.database_file)
+                conn.cursor().execute(select_statement, (next(release_ids),)).fetchall()
+                conn.close()
+
+            results['sqlite_per_call_connection'] = time_calls(per_call_connection, calls)
+            results['sqlite_persistent_connection'] = time_calls(lambda: sd.get_release(next(release_ids)), calls)
+
+            release_url = stub.url + '/releases/' + str(next(release_ids)) + '?token=token'
+            connections = stub.connections
+            results['http_per_call_connection'] = time_calls(lambda: requests.get(release_url, headers=sd.discogs_headers), calls)
+            results['http_per_call_connection']['connections'] = stub.connections - connections
+            connections = stub.connections
+            results['http_pooled_session'] = time_calls(lambda: sd.scheduler.fetch(release_url, cacheable=False), calls)
+            results['http_pooled_session']['connections'] = stub.connections - connections
+            sd.api_get(release_url)
+            requests_before = stub.requests
+            results['http_cached'] = time_calls(lambda: sd.api_get(release_url), calls)
+            results['http_cached']['requests'] = stub.requests - requests_before
+    return results
+
+
+def bench_sync(release_count=500, latency=0.02, rate_window=5):
+    results = {}
+    for name, max_workers, rate_limit in [('serial', 1, 10 ** 6), ('workers_8', 8, 10 ** 6), ('workers_8_rate_limited', 8, 100)]:
+        with tempfile.TemporaryDirectory() as directory, \
+                StubDiscogsServer(release_count, rate_limit=rate_limit, rate_window=rate_window, latency=latency) as stub:
+            start = perf_counter()
+            with SimpleDiscogs('bench', 'token', database_location=directory, api_url=stub.url,
+                               max_workers=max_workers, rate_window=rate_window) as sd:
+                elapsed = perf_counter() - start
+                results[name] = {'seconds': round(elapsed, 3), 'requests': stub.requests, 'rejected': stub.rejected,
+                                 'releases': len(sd.browse('all'))}
+    return results
+
+
+def build_synthetic_database(database_file, release_count=50000, tracks_per_release=10, seed=0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(database_file)
+    conn.execute('CREATE TABLE RELEASES (RELEASE_ID INTEGER PRIMARY KEY,FOLDER_ID,CATALOG_ID,ARTISTS_ID,DATE_ADDED DATETIME,YEAR,DECADE,'
+                 'ARTIST,TITLE,LABEL,FORMAT,GENRE,STYLE,RELEASE_URL,MASTER_URL,THUMB_URL,COVER_URL)')
+    conn.execute('CREATE TABLE SONGS (SONG_ID INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,TITLE,RELEASE,ARTIST,LENGTH,'
+                 'DISCOGS_RELEASE_ID INTEGER,DISCOGS_RELEASE_TRACK)')
+    artists = [make_title(rng, rng.randint(1, 3)) + ' ' + str(index) for index in range(max(1, release_count // 5))]
+    releases, songs = [], []
+    for index in range(release_count):
+        release_id = 100000 + index
+        year = rng.randint(1955, 2023)
+        artist = rng.choice(artists)
+        if rng.random() < 0.1:
+            artist += '|' + rng.choice(artists)
+        title = make_title(rng, rng.randint(1, 4))
+        releases.append((release_id, 1, 'CAT-' + str(index), str(index), '2020-01-01 00:00:00', year, year // 10 * 10, artist, title,
+                         make_title(rng, 1) + ' Records', 'vinyl|lp', '|'.join(rng.sample(GENRES, 2)).lower(),
+                         '|'.join(rng.sample(STYLES, 2)).lower(), '', '', '', ''))
+        for position in range(tracks_per_release):
+            seconds = rng.randint(90, 540)
+            songs.append((None, make_title(rng, rng.randint(1, 4)), title, artist.split('|')[0],
+                          '00:%02d:%02d' % (seconds // 60, seconds % 60), release_id, str(position + 1)))
+    conn.executemany('INSERT INTO RELEASES VALUES (' + ','.join('?' * 17) + ')', releases)
+    conn.executemany('INSERT INTO SONGS VALUES (' + ','.join('?' * 7) + ')', songs)
+    conn.commit()
+    conn.close()
+    return [release[0] for release in releases], [release[7].split('|')[0] for release in releases]
+
+
+def bench_schema(release_count=50000, tracks_per_release=10, calls=200):
+    results = {}
+    song_fields = 'SONG_ID,TITLE,RELEASE,ARTIST,LENGTH,DISCOGS_RELEASE_ID,DISCOGS_RELEASE_TRACK'
+    release_fields = 'RELEASE_ID,FOLDER_ID,CATALOG_ID,ARTISTS_ID,DATE_ADDED,YEAR,DECADE,ARTIST,TITLE,LABEL,FORMAT,GENRE,STYLE,' \
+                     'RELEASE_URL,MASTER_URL,THUMB_URL,COVER_URL'
+    with tempfile.TemporaryDirectory() as legacy_directory, tempfile.TemporaryDirectory() as directory:
+        legacy_file = path.join(legacy_directory, 'simple_discogs.sqlite')
+        release_ids, artists = build_synthetic_database(legacy_file, release_count, tracks_per_release)
+        shutil.copy(legacy_file, path.join(directory, 'simple_discogs.sqlite'))
+        start = perf_counter()
+        sd = SimpleDiscogs('bench', 'token', database_location=directory, update_on_init=False)
+        results['migration_seconds'] = round(perf_counter() - start, 3)
+        rng = random.Random(1)
+        results['browse_artist'] = time_calls(lambda: sd.browse('ARTIST', rng.choice(artists)), calls)
+        results['query_songs_by_length'] = time_calls(lambda: sd.query_songs(min_length='3:00', max_length='3:05'), calls)
+        sd.close()
+
+        queries = {'songs_by_release': ('SELECT ' + song_fields + ' FROM SONGS WHERE DISCOGS_RELEASE_ID = ?',
+                                        lambda rng: (rng.choice(release_ids), )),
+                   'songs_by_length': ('SELECT ' + song_fields + ' FROM SONGS WHERE LENGTH <= ? AND LENGTH >= ?',
+                                       lambda rng: ('00:03:05', '00:03:00')),
+                   'releases_by_artist': ('SELECT ' + release_fields + ' FROM RELEASES WHERE ARTIST = ? COLLATE NOCASE',
+                                          lambda rng: (rng.choice(artists), )),
+                   'releases_by_year': ('SELECT ' + release_fields + ' FROM RELEASES WHERE YEAR = ? ORDER BY YEAR, ARTIST, TITLE',
+                                        lambda rng: (rng.randint(1955, 2023), )),
+                   'releases_sorted_page': ('SELECT ' + release_fields + ' FROM RELEASES '
+                                            'ORDER BY ARTIST COLLATE NOCASE ASC, YEAR ASC, TITLE COLLATE NOCASE ASC LIMIT 100', lambda rng: ())}
+        for schema, database_file in [('legacy', legacy_file), ('migrated', path.join(directory, 'simple_discogs.sqlite'))]:
+            conn = sqlite3.connect(database_file)
+            rng = random.Random(1)
+            results[schema] = {name: time_calls(lambda: conn.execute(statement, values(rng)).fetchall(), calls)
+                               for name, (statement, values) in queries.items()}
+            conn.close()
+
+        conn = sqlite3.connect(legacy_file)
+        rng = random.Random(1)
+        select_statement = 'SELECT ' + release_fields + ' FROM RELEASES WHERE ARTIST LIKE ? OR ARTIST LIKE ? OR ARTIST LIKE ? ' \
+                           'OR ARTIST LIKE ? COLLATE NOCASE ORDER BY ARTIST ASC, YEAR ASC, TITLE ASC'
+
+        def browse_like(artist):
+            return conn.execute(select_statement, (artist, artist + '|%', '%|' + artist + '|%', '%|' + artist)).fetchall()
+
+        results['legacy']['browse_artist'] = time_calls(lambda: browse_like(rng.choice(artists)), calls)
+        select_statement = 'SELECT ' + song_fields + ' FROM SONGS WHERE LENGTH <= ? AND LENGTH >= ?'
+        results['legacy']['query_songs_by_length'] = time_calls(lambda: conn.execute(select_statement, ('00:03:05', '00:03:00')).fetchall(), calls)
+        conn.close()
+        results['migrated']['browse_artist'] = results.pop('browse_artist')
+        results['migrated']['query_songs_by_length'] = results.pop('query_songs_by_length')
+    return results
+
+
+def legacy_unique_list(conn, category):
+    entry_list = []
+    for row in conn.execute('SELECT ' + category + ' FROM RELEASES').fetchall():
+        if type(row[0]) == str:
+            entry_list += row[0].split('|')
+        elif type(row[0]) == int:
+            entry_list.append('unknown' if row[0] == 0 else str(row[0]))
+    entry_counts = list(set([(entry, entry_list.count(entry)) for entry in entry_list]))
+    return sorted([{'name': entry, 'count': total} for entry, total in entry_counts], key=lambda k: k['name'].upper())
+
+
+def bench_facets(release_count=10000, calls=5):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        database_file = path.join(directory, 'simple_discogs.sqlite')
+        build_synthetic_database(database_file, release_count, tracks_per_release=1)
+        conn = sqlite3.connect(database_file)
+        results['legacy_artist_list'] = time_calls(lambda: legacy_unique_list(conn, 'ARTIST'), calls)
+        conn.close()
+        with SimpleDiscogs('bench', 'token', database_location=directory, update_on_init=False) as sd:
+            results['artist_list'] = time_calls(lambda: sd.get_unique_list('ARTIST'), calls)
+            results['available_categories'] = time_calls(sd.get_available_categories, calls)
+    return results
+
+
+def bench_startup(release_count=2000, latency=0.2):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        stub = StubDiscogsServer(release_count, rate_limit=10 ** 9).start()
+        SimpleDiscogs('bench', 'token', database_location=directory, api_url=stub.url, max_workers=8).close()
+        stub.latency = latency
+        for mode, update_on_init in [('blocking', True), ('lazy', False)]:
+            start = perf_counter()
+            with SimpleDiscogs('bench', 'token', database_location=directory, api_url=stub.url, update_on_init=update_on_init) as sd:
+                artists = sd.get_unique_list('ARTIST')
+                results[mode] = {'seconds': round(perf_counter() - start, 4), 'artists': len(artists)}
+        stub.stop()
+        for mode, update_on_init in [('offline_blocking', True), ('offline_lazy', False)]:
+            start = perf_counter()
+            try:
+                with SimpleDiscogs('bench', 'token', database_location=directory, api_url=stub.url, update_on_init=update_on_init) as sd:
+                    results[mode] = {'seconds': round(perf_counter() - start, 4), 'artists': len(sd.get_unique_list('ARTIST'))}
+            except requests.RequestException as error:
+                results[mode] = {'seconds': round(perf_counter() - start, 4), 'error': type(error).__name__}
+    return results
+
+
+def bench_search(release_count=50000, tracks_per_release=10, calls=50):
+    results = {}
+    terms = ['he', 'heart', 'heart sig', 'silver moon', 'zebra']
+    with tempfile.TemporaryDirectory() as directory:
+        build_synthetic_database(path.join(directory, 'simple_discogs.sqlite'), release_count, tracks_per_release)
+        with SimpleDiscogs('bench', 'token', database_location=directory, update_on_init=False) as sd:
+            for term in terms:
+                results[term] = {'title_like_scan': time_calls(lambda: sd.query_songs(title=term), 3),
+                                 'search': time_calls(lambda: sd.search(term), calls)}
+    return results
+
+
+def bench_cache(release_count=200, latency=0.02):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, StubDiscogsServer(release_count, rate_limit=10 ** 6, latency=latency) as stub:
+        with SimpleDiscogs('bench', 'token', database_location=directory, api_url=stub.url) as sd:
+            release_ids = [release['RELEASE_ID'] for release in sd.browse('all')]
+            for name in ['cold_video_lookups', 'warm_video_lookups']:
+                requests_before = stub.requests
+                start = perf_counter()
+                for release_id in release_ids:
+                    sd.get_video_list(release_id)
+                results[name] = {'seconds': round(perf_counter() - start, 3), 'requests': stub.requests - requests_before}
+            requests_before = stub.requests
+            start = perf_counter()
+            sd.update_releases(full=True)
+            results['full_resync'] = {'seconds': round(perf_counter() - start, 3), 'requests': stub.requests - requests_before,
+                                      'not_modified': stub.not_modified}
+            results['cache'] = {'hits': sd.cache.hits, 'revalidated': sd.cache.revalidated, 'misses': sd.cache.misses,
+                                'bytes': sd.cache.total_bytes}
+    return results
+
+
+def bench_scaling(sizes=(1000, 10000, 100000), sync_sizes=(1000, 5000), calls=50):
+    results = {}
+    rng = random.Random(2)
+    for size in sizes:
+        results[str(size)] = scale = {}
+        if size in sync_sizes:
+            with tempfile.TemporaryDirectory() as directory, StubDiscogsServer(size, rate_limit=10 ** 9) as stub:
+                with SimpleDiscogs('bench', 'token', database_location=directory, api_url=stub.url, max_workers=8,
+                                   update_on_init=False) as sd:
+                    start = perf_counter()
+                    sd.update_releases()
+                    scale['update_releases'] = {'seconds': round(perf_counter() - start, 3), 'requests': stub.requests}
+                    release_ids = iter(rng.sample(list(stub.releases), min(calls, size)))
+                    scale['get_track_list_download'] = time_calls(lambda: sd.get_track_list(next(release_ids)), min(calls, size))
+        with tempfile.TemporaryDirectory() as directory:
+            release_ids, artists = build_synthetic_database(path.join(directory, 'simple_discogs.sqlite'), size, seed=size)
+            start = perf_counter()
+            sd = SimpleDiscogs('bench', 'token', database_location=directory, update_on_init=False)
+            scale['migration'] = {'seconds': round(perf_counter() - start, 3)}
+            genres = [genre.lower() for genre in GENRES]
+            scale['get_unique_list'] = time_calls(lambda: sd.get_unique_list('ARTIST'), 5)
+            scale['browse_artist'] = time_calls(lambda: sd.browse('ARTIST', rng.choice(artists)), calls)
+            scale['browse_genre'] = time_calls(lambda: sd.browse('GENRE', rng.choice(genres)), 5)
+            scale['browse_all'] = time_calls(lambda: sd.browse('all'), 3)
+            scale['iter_browse_first_page'] = time_calls(lambda: list(itertools.islice(sd.iter_browse('all'), 200)), 5)
+            scale['query_songs_by_artist'] = time_calls(lambda: sd.query_songs(artist=rng.choice(artists)), calls)
+            scale['query_songs_by_length'] = time_calls(lambda: sd.query_songs(min_length='3:00', max_length='3:02'), calls)
+            first_page = sd.find_songs(genre='rock', limit=100)
+            scale['find_songs_first_page'] = time_calls(lambda: sd.find_songs(genre=rng.choice(genres), limit=100), calls)
+            scale['find_songs_next_page'] = time_calls(lambda: sd.find_songs(genre='rock', limit=100, after=first_page['next']), calls)
+            scale['get_track_list'] = time_calls(lambda: sd.get_track_list(rng.choice(release_ids)), calls)
+            pool = sd.query_songs(min_length='2:00', max_length='6:00')[:500]
+            side = pool[:12]
+            scale['calculate_sides'] = time_calls(lambda: Playlist(side).total_time(), calls)
+            scale['fit_tape'] = time_calls(lambda: fit_tape(pool, 'C90', max_per_artist=2), 5)
+            start = perf_counter()
+            sd.get_similarity_index().refresh()
+            scale['similarity_index'] = {'seconds': round(perf_counter() - start, 3)}
+            exclude = [song['SONG_ID'] for song in side]
+            scale['suggest_tracks'] = time_calls(lambda: sd.suggest_tracks(rng.choice(pool)['SONG_ID'], 1200, exclude), calls)
+            scale['fill_suggestions'] = time_calls(lambda: sd.fill_suggestions(rng.choice(pool)['SONG_ID'], 1200, exclude), calls)
+            sd.close()
+    smallest, largest = str(min(sizes)), str(max(sizes))
+    if smallest != largest:
+        results['growth'] = {}
+        for name, timing in results[largest].items():
+            if 'p50_ms' in timing and name in results[smallest] and results[smallest][name]['p50_ms'] > 0:
+                # Exponent k in time ~ size^k between the smallest and largest collection, so 1.0 means linear.
+                results['growth'][name] = round(math.log(timing['p50_ms'] / results[smallest][name]['p50_ms']) /
+                                                math.log(max(sizes) / min(sizes)), 2)
+    return results
+
+
+BENCHMARKS = {'connections': bench_connections, 'sync': bench_sync, 'schema': bench_schema, 'facets': bench_facets, 'startup': bench_startup,
+              'search': bench_search, 'cache': bench_cache, 'scaling': bench_scaling}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=path.dirname(path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform()}
+
+
+def timings(results, prefix=''):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from timings(value, prefix + key + '/')
+        elif key in ('p50_ms', 'seconds'):
+            yield prefix + key, value
+
+
+def compare(baseline, current, threshold=1.5, min_delta_ms=1.0):
+    baseline_timings = dict(timings(baseline['results']))
+    regressions = []
+    for name, value in timings(current['results']):
+        previous = baseline_timings.get(name)
+        if previous is None:
+            continue
+        delta_ms = (value - previous) * (1000 if name.endswith('seconds') else 1)
+        if value > previous * threshold and delta_ms > min_delta_ms:
+            regressions.append({'name': name, 'baseline': previous, 'current': value, 'ratio': round(value / (previous or 1e-9), 2)})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark SimpleDiscogs against a local stub of the Discogs API.')
+    parser.add_argument('benchmarks', nargs='*', choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='collection sizes for the scaling benchmark')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file from an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.5, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+    options = {'scaling': {'sizes': args.sizes}}
+    report = {'environment': environment(),
+              'results': {name: BENCHMARKS[name](**options.get(name, {})) for name in args.benchmarks}}
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=4)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(json.load(baseline_file), report, args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression['name'] + ': ' + str(regression['baseline']) + ' -> ' + str(regression['current']) +
+                  ' (' + str(regression['ratio']) + 'x)', file=sys.stderr)
+        sys.exit(1 if regressions else 0)
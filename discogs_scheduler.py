@@ -0,0 +1,129 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, perf_counter, sleep
+from urllib.parse import urlsplit
+
+import requests
+
+
+class RateLimitError(requests.HTTPError):
+    pass
+
+
+class RateLimiter:
+    def __init__(self, calls_per_window=60, window=60, max_backoff=60):
+        self.capacity = calls_per_window
+        self.window = window
+        self.max_backoff = max_backoff
+        self.tokens = float(calls_per_window)
+        self.updated = monotonic()
+        self.blocked_until = 0
+        self.backoff_delay = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.window)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) * self.window / self.capacity)
+            sleep(wait)
+
+    def update(self, headers):
+        limit = headers.get('X-Discogs-Ratelimit')
+        remaining = headers.get('X-Discogs-Ratelimit-Remaining')
+        with self.lock:
+            self.refill(monotonic())
+            if limit is not None and int(limit) > 0:
+                self.capacity = int(limit)
+            if remaining is not None:
+                self.tokens = min(self.tokens, float(remaining))
+            self.backoff_delay = 0
+
+    def backoff(self, retry_after=None):
+        with self.lock:
+            self.throttled += 1
+            now = monotonic()
+            if retry_after is None:
+                if now < self.blocked_until:
+                    return self.blocked_until - now
+                self.backoff_delay = min(self.max_backoff, self.backoff_delay * 2 or 1)
+                retry_after = self.backoff_delay
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.tokens = min(self.tokens, 0)
+            return retry_after
+
+
+class FetchScheduler:
+    def __init__(self, session, rate_limiter=None, max_workers=4, max_retries=8, cache=None, metrics=None):
+        self.session = session
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.cache = cache
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='discogs-fetch')
+
+    def fetch(self, url, max_age=None, cacheable=True):
+        if self.metrics is None:
+            return self.fetch_response(url, max_age, cacheable)
+        endpoint = urlsplit(url).path.strip('/').split('/')[0] or 'root'
+        start = perf_counter()
+        response = self.fetch_response(url, max_age, cacheable, endpoint)
+        source = 'cache' if getattr(response, 'from_cache', False) else 'network'
+        self.metrics.observe('discogs_fetch_seconds', perf_counter() - start, endpoint=endpoint, source=source)
+        if self.cache is not None and cacheable:
+            lookups = self.cache.hits + self.cache.revalidated + self.cache.misses
+            self.metrics.set_gauge('discogs_cache_hit_ratio', round((self.cache.hits + self.cache.revalidated) / (lookups or 1), 4))
+        return response
+
+    def get(self, url, headers, endpoint):
+        if self.metrics is None:
+            return self.session.get(url, headers=headers)
+        start = perf_counter()
+        response = self.session.get(url, headers=headers)
+        self.metrics.observe('discogs_http_request_seconds', perf_counter() - start, endpoint=endpoint, status=str(response.status_code))
+        self.metrics.increment('discogs_http_response_bytes_total', len(response.content), endpoint=endpoint)
+        remaining = response.headers.get('X-Discogs-Ratelimit-Remaining')
+        if remaining is not None:
+            self.metrics.set_gauge('discogs_ratelimit_remaining', int(remaining))
+        return response
+
+    def fetch_response(self, url, max_age=None, cacheable=True, endpoint=None):
+        cache = self.cache if cacheable else None
+        entry = cache.lookup(url) if cache is not None else None
+        if entry is not None and cache.is_fresh(entry, max_age):
+            cache.touch(url)
+            return cache.make_response(url, entry)
+        headers = cache.conditional_headers(entry) if entry is not None else None
+        for _ in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            response = self.get(url, headers, endpoint)
+            if response.status_code != 429:
+                self.rate_limiter.update(response.headers)
+                if response.status_code == 304 and entry is not None:
+                    cache.touch(url, refreshed=True)
+                    return cache.make_response(url, entry)
+                if response.status_code == 200 and cache is not None:
+                    cache.store(url, response)
+                return response
+            retry_after = response.headers.get('Retry-After')
+            self.rate_limiter.backoff(float(retry_after) if retry_after else None)
+        raise RateLimitError('Discogs rate limit still exceeded after ' + str(self.max_retries) + ' retries for ' + urlsplit(url).path,
+                             response=response)
+
+    def submit(self, url, max_age=None):
+        return self.executor.submit(self.fetch, url, max_age)
+
+    def map(self, urls, max_age=None):
+        return list(self.executor.map(lambda url: self.fetch(url, max_age), urls))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
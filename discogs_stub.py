@@ -0,0 +1,236 @@
+import hashlib
+import json
+import random
+import struct
+import zlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from urllib.parse import urlparse, parse_qs
+
+GENRES = ['Rock', 'Electronic', 'Jazz', 'Funk / Soul', 'Hip Hop', 'Pop', 'Reggae', 'Blues', 'Classical', 'Folk, World, & Country']
+STYLES = ['Punk', 'House', 'Techno', 'Soul', 'Bop', 'Dub', 'Synth-pop', 'Post-Punk', 'Indie Rock', 'Ambient',
+          'Disco', 'Hard Bop', 'Roots Reggae', 'Electric Blues', 'Garage Rock', 'Krautrock', 'Downtempo', 'Boom Bap']
+FORMATS = [('Vinyl', ['LP', 'Album']), ('Vinyl', ['12"', '45 RPM']), ('Cassette', ['Album']), ('CD', ['Album']), ('Vinyl', ['7"', 'Single'])]
+WORDS = ['night', 'blue', 'river', 'electric', 'dream', 'city', 'fire', 'love', 'machine', 'summer', 'ghost',
+         'gold', 'heart', 'shadow', 'signal', 'tape', 'echo', 'wild', 'silver', 'moon', 'north', 'static',
+         'the', 'of', 'in', 'and', 'my', 'your', 'no', 'on', 'to', 'all', 'we', 'are', 'one', 'time', 'way', 'home', 'girl',
+         'boy', 'world', 'life', 'day', 'sun', 'rain', 'star', 'sky', 'road', 'train', 'highway', 'dance', 'party', 'song',
+         'soul', 'groove', 'funk', 'sound', 'system', 'radio', 'station', 'avenue', 'street', 'paradise', 'desert', 'ocean',
+         'island', 'mountain', 'valley', 'winter', 'spring', 'autumn', 'midnight', 'morning', 'evening', 'red', 'black',
+         'white', 'green', 'golden', 'broken', 'lonely', 'crazy', 'sweet', 'cold', 'hot', 'slow', 'fast', 'lost', 'free',
+         'young', 'old', 'new', 'last', 'first', 'little', 'big', 'secret', 'magic', 'mirror', 'window', 'garden', 'angel',
+         'devil', 'king', 'queen', 'rider', 'runner', 'dreamer', 'stranger', 'lover', 'baby', 'tonight', 'forever', 'again',
+         'away', 'down', 'up', 'over', 'under', 'blues', 'jam', 'theme', 'suite', 'interlude', 'reprise', 'intro', 'outro']
+
+
+def make_title(rng, words=2):
+    # Skew word choice like real titles, where a few words turn up far more often than the rest.
+    return ' '.join(WORDS[int(len(WORDS) ** rng.random()) - 1].capitalize() for _ in range(words))
+
+
+def make_tracklist(rng, format_name, track_count):
+    if format_name == 'CD':
+        positions = [str(number) for number in range(1, track_count + 1)]
+    else:
+        sides = 'ABCD' if format_name == 'Vinyl' and track_count > 12 else 'AB'
+        per_side = (track_count + len(sides) - 1) // len(sides)
+        positions = [sides[index // per_side] + str(index % per_side + 1) for index in range(track_count)]
+    tracklist = []
+    if rng.random() < 0.1:
+        tracklist.append({'position': '', 'type_': 'heading', 'title': make_title(rng, 2), 'duration': ''})
+    for position in positions:
+        seconds = int(min(1500, max(45, rng.lognormvariate(5.4, 0.35))))
+        duration = '%d:%02d' % (seconds // 60, seconds % 60) if rng.random() > 0.05 else ''
+        tracklist.append({'position': position, 'type_': 'track', 'title': make_title(rng, rng.randint(1, 4)), 'duration': duration})
+    return tracklist
+
+
+def make_image(seed, size=32):
+    rng = random.Random(seed)
+    red, green, blue = rng.randrange(256), rng.randrange(256), rng.randrange(256)
+    rows = b''.join(b'\x00' + bytes([red, green ^ (row * 8 % 256), blue]) * size for row in range(size))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def make_collection(release_count, seed=0, base_url='https://api.discogs.com', min_tracks=6, max_tracks=14, master_ratio=0.7):
+    rng = random.Random(seed)
+    artists = [{'name': make_title(rng, rng.randint(1, 3)) + ' ' + str(index), 'id': 1000 + index}
+               for index in range(max(1, release_count // 4))]
+    collection, masters, releases = [], {}, {}
+    for index in range(release_count):
+        release_id = 100000 + index
+        master_id = 500000 + index if rng.random() < master_ratio else 0
+        artist = rng.choice(artists)
+        year = rng.randint(1955, 2023)
+        title = make_title(rng, rng.randint(1, 4))
+        format_name, descriptions = rng.choice(FORMATS)
+        genres = rng.sample(GENRES, rng.randint(1, 2))
+        styles = rng.sample(STYLES, rng.randint(1, 3))
+        label = {'name': make_title(rng, 1) + ' Records', 'catno': 'CAT-' + str(rng.randint(1, 9999)), 'id': rng.randint(1, 500)}
+        collection.append({
+            'id': release_id,
+            'instance_id': 900000 + index,
+            'folder_id': 1,
+            'rating': 0,
+            'date_added': '%04d-%02d-%02dT%02d:%02d:%02d-07:00' % (2015 + index * 8 // max(1, release_count), rng.randint(1, 12),
+                                                                   rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59),
+                                                                   index % 60),
+            'basic_information': {
+                'id': release_id,
+                'master_id': master_id,
+                'master_url': base_url + '/masters/' + str(master_id) if master_id else None,
+                'resource_url': base_url + '/releases/' + str(release_id),
+                'thumb': base_url + '/images/' + str(release_id) + '-thumb.jpg',
+                'cover_image': base_url + '/images/' + str(release_id) + '.jpg',
+                'title': title,
+                'year': year,
+                'formats': [{'name': format_name, 'qty': '1', 'descriptions': descriptions}],
+                'labels': [label],
+                'artists': [artist],
+                'genres': genres,
+                'styles': styles}})
+        if master_id:
+            masters[master_id] = {'id': master_id, 'title': title, 'year': year, 'genres': genres, 'styles': styles}
+        tracklist = make_tracklist(rng, format_name, rng.randint(min_tracks, max_tracks))
+        releases[release_id] = {'id': release_id, 'title': title, 'year': year, 'artists': [artist],
+                                'genres': genres, 'styles': styles, 'tracklist': tracklist,
+                                'videos': [{'uri': 'https://www.youtube.com/watch?v=' + str(release_id), 'title': title}]}
+    return collection, masters, releases
+
+
+class StubDiscogsHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.stub.connections += 1
+        if self.server.stub.handshake_latency:
+            sleep(self.server.stub.handshake_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        self.send_data(status, json.dumps(body).encode('utf-8'), 'application/json', headers)
+
+    def send_data(self, status, data, content_type, headers=None):
+        if status == 200:
+            etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            headers = dict(headers or {}, ETag=etag)
+            if self.headers.get('If-None-Match') == etag:
+                self.server.stub.not_modified += 1
+                status, data = 304, b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        stub = self.server.stub
+        if stub.latency:
+            sleep(stub.latency)
+        allowed, rate_headers = stub.take_call()
+        if not allowed:
+            self.send_json(429, {'message': "You are making requests too quickly."}, rate_headers)
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        if len(parts) == 6 and parts[0] == 'users' and parts[2] == 'collection' and parts[5] == 'releases':
+            self.send_json(200, stub.collection_page(query), rate_headers)
+        elif len(parts) == 2 and parts[0] == 'masters' and int(parts[1]) in stub.masters:
+            self.send_json(200, stub.masters[int(parts[1])], rate_headers)
+        elif len(parts) == 2 and parts[0] == 'releases' and int(parts[1]) in stub.releases:
+            self.send_json(200, stub.releases[int(parts[1])], rate_headers)
+        elif len(parts) == 2 and parts[0] == 'images' and parts[1].split('-')[0].split('.')[0].isdigit():
+            stub.images += 1
+            self.send_data(200, make_image(parts[1]), 'image/png', rate_headers)
+        else:
+            self.send_json(404, {'message': 'The requested resource was not found.'}, rate_headers)
+
+
+class StubDiscogsServer:
+    def __init__(self, release_count=100, seed=0, rate_limit=60, rate_window=60, latency=0.0, handshake_latency=0.0, port=0):
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.latency = latency
+        self.handshake_latency = handshake_latency
+        self.connections = 0
+        self.requests = 0
+        self.rejected = 0
+        self.not_modified = 0
+        self.images = 0
+        self.call_times = []
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), StubDiscogsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self.thread = None
+        self.collection, self.masters, self.releases = make_collection(release_count, seed=seed, base_url=self.url)
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:' + str(self.httpd.server_address[1])
+
+    def take_call(self):
+        with self.lock:
+            now = time()
+            self.call_times = [stamp for stamp in self.call_times if now - stamp < self.rate_window]
+            self.requests += 1
+            allowed = len(self.call_times) < self.rate_limit
+            if allowed:
+                self.call_times.append(now)
+            else:
+                self.rejected += 1
+            used = len(self.call_times)
+        headers = {'X-Discogs-Ratelimit': str(self.rate_limit), 'X-Discogs-Ratelimit-Used': str(used),
+                   'X-Discogs-Ratelimit-Remaining': str(max(0, self.rate_limit - used))}
+        return allowed, headers
+
+    def collection_page(self, query):
+        per_page = int(query.get('per_page', ['50'])[0])
+        page = int(query.get('page', ['1'])[0])
+        releases = self.collection
+        if query.get('sort', [''])[0] == 'added':
+            releases = sorted(releases, key=lambda release: release['date_added'],
+                              reverse=query.get('sort_order', ['asc'])[0] == 'desc')
+        pages = max(1, (len(releases) + per_page - 1) // per_page)
+        return {'pagination': {'page': page, 'pages': pages, 'per_page': per_page, 'items': len(releases)},
+                'releases': releases[(page - 1) * per_page:page * per_page]}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve a synthetic Discogs collection for local testing.')
+    parser.add_argument('--releases', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rate-limit', type=int, default=60)
+    args = parser.parse_args()
+    server = StubDiscogsServer(release_count=args.releases, rate_limit=args.rate_limit, port=args.port)
+    print('Serving ' + str(args.releases) + ' releases on ' + server.url)
+    server.httpd.serve_forever()
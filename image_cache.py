@@ -0,0 +1,60 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from os import path
+from time import time
+
+
+class ImageCache:
+    def __init__(self, directory, scheduler):
+        self.directory = directory
+        self.scheduler = scheduler
+        self.downloads = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path.join(directory, 'index.sqlite'), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS IMAGES (URL TEXT PRIMARY KEY, DIGEST TEXT NOT NULL, SIZE INTEGER, FETCHED REAL)')
+        self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def image_path(self, digest):
+        return path.join(self.directory, digest[:2], digest)
+
+    def cached_path(self, url):
+        with self.lock:
+            row = self.conn.execute('SELECT DIGEST FROM IMAGES WHERE URL = ?', (url, )).fetchone()
+        if row is None or not path.exists(self.image_path(row[0])):
+            return None
+        return self.image_path(row[0])
+
+    def store(self, url, data):
+        digest = hashlib.sha256(data).hexdigest()
+        image_path = self.image_path(digest)
+        if not path.exists(image_path):
+            os.makedirs(path.dirname(image_path), exist_ok=True)
+            temporary_path = image_path + '.' + str(threading.get_ident()) + '.tmp'
+            with open(temporary_path, 'wb') as image_file:
+                image_file.write(data)
+            os.replace(temporary_path, image_path)
+        with self.lock:
+            self.downloads += 1
+            self.conn.execute('INSERT OR REPLACE INTO IMAGES (URL, DIGEST, SIZE, FETCHED) VALUES (?, ?, ?, ?)', (url, digest, len(data), time()))
+            self.conn.commit()
+        return image_path
+
+    def get(self, url):
+        if not url:
+            return None
+        image_path = self.cached_path(url)
+        if image_path is None:
+            response = self.scheduler.fetch(url, cacheable=False)
+            if response.status_code != 200 or not response.content:
+                return None
+            image_path = self.store(url, response.content)
+        with open(image_path, 'rb') as image_file:
+            return image_file.read()
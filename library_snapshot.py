@@ -0,0 +1,80 @@
+import json
+import os
+import sqlite3
+import struct
+import zlib
+from datetime import datetime
+
+SNAPSHOT_MAGIC = b'MTSNAP'
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_TABLES = ['RELEASES', 'SONGS', 'HYDRATED_RELEASES']
+CHUNK_SIZE = 1024 * 1024
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def copy_tables(source_file, database_file, tables=SNAPSHOT_TABLES):
+    conn = sqlite3.connect(database_file)
+    try:
+        conn.execute('ATTACH DATABASE ? AS source', (source_file, ))
+        counts = {}
+        with conn:
+            conn.execute('BEGIN')
+            for table in tables:
+                create_statement = conn.execute("SELECT sql FROM source.sqlite_master WHERE type = 'table' AND name = ?", (table, )).fetchone()
+                if create_statement is None:
+                    continue
+                conn.execute(create_statement[0])
+                conn.execute(f'INSERT INTO main.{table} SELECT * FROM source.{table}')
+                counts[table] = conn.execute(f'SELECT COUNT(*) FROM main.{table}').fetchone()[0]
+            version = conn.execute('PRAGMA source.user_version').fetchone()[0]
+        conn.execute('DETACH DATABASE source')
+        conn.execute('PRAGMA user_version = ' + str(version))
+    finally:
+        conn.close()
+    return version, counts
+
+
+def write_snapshot(source_file, filename, level=6):
+    temporary_database = filename + '.sqlite.tmp'
+    temporary_file = filename + '.tmp'
+    try:
+        version, counts = copy_tables(source_file, temporary_database)
+        header = json.dumps({'format': SNAPSHOT_FORMAT, 'schema_version': version, 'created': datetime.now().isoformat(timespec='seconds'),
+                             'tables': counts}).encode('utf-8')
+        compressor = zlib.compressobj(level)
+        with open(temporary_database, 'rb') as database, open(temporary_file, 'wb') as snapshot:
+            snapshot.write(SNAPSHOT_MAGIC + struct.pack('>HI', SNAPSHOT_FORMAT, len(header)) + header)
+            for chunk in iter(lambda: database.read(CHUNK_SIZE), b''):
+                snapshot.write(compressor.compress(chunk))
+            snapshot.write(compressor.flush())
+        os.replace(temporary_file, filename)
+    finally:
+        for leftover in (temporary_database, temporary_file):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return {'schema_version': version, 'tables': counts}
+
+
+def read_header(snapshot):
+    prefix = snapshot.read(len(SNAPSHOT_MAGIC) + 6)
+    if len(prefix) < len(SNAPSHOT_MAGIC) + 6 or not prefix.startswith(SNAPSHOT_MAGIC):
+        raise SnapshotError('Not a MixedTaper library snapshot')
+    snapshot_format, header_length = struct.unpack('>HI', prefix[len(SNAPSHOT_MAGIC):])
+    if snapshot_format > SNAPSHOT_FORMAT:
+        raise SnapshotError('Snapshot format ' + str(snapshot_format) + ' is newer than this version of MixedTaper')
+    return json.loads(snapshot.read(header_length).decode('utf-8'))
+
+
+def read_snapshot(filename, database_file):
+    decompressor = zlib.decompressobj()
+    with open(filename, 'rb') as snapshot, open(database_file, 'wb') as database:
+        header = read_header(snapshot)
+        for chunk in iter(lambda: snapshot.read(CHUNK_SIZE), b''):
+            database.write(decompressor.decompress(chunk))
+        database.write(decompressor.flush())
+        if not decompressor.eof:
+            raise SnapshotError('Snapshot is truncated')
+    return header
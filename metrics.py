@@ -0,0 +1,226 @@
+import cProfile
+import functools
+import inspect
+import json
+import os
+import re
+import sqlite3
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': round(self.sum, 6), 'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'max': round(self.max, 6)}
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, amount=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def timed(self, name, **labels):
+        def decorator(function):
+            parameters = inspect.signature(function).parameters.values()
+            if any(parameter.kind == parameter.VAR_POSITIONAL for parameter in parameters):
+                arity = None
+            else:
+                arity = len([parameter for parameter in parameters if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)])
+
+            # Qt drops signal arguments a slot does not accept, so do the same for the wrapped slot.
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, handler=function.__name__, **labels):
+                    return function(*args[:arity], **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def to_dict(self):
+        with self.lock:
+            result = {'counters': [], 'gauges': [], 'histograms': []}
+            for kind, values in [('counters', self.counters), ('gauges', self.gauges)]:
+                for (name, labels), value in sorted(values.items()):
+                    result[kind].append({'name': name, 'labels': dict(labels), 'value': value})
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                result['histograms'].append(dict(name=name, labels=dict(labels), **histogram.to_dict()))
+        return result
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        def label_text(labels, extra=()):
+            labels = list(labels) + list(extra)
+            if not labels:
+                return ''
+            return '{' + ','.join(key + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"' for key, value in labels) + '}'
+
+        lines = []
+        with self.lock:
+            for kind, values in [('counter', self.counters), ('gauge', self.gauges)]:
+                current = None
+                for (name, labels), value in sorted(values.items()):
+                    if name != current:
+                        lines.append('# TYPE ' + name + ' ' + kind)
+                        current = name
+                    lines.append(name + label_text(labels) + ' ' + str(value))
+            current = None
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name != current:
+                    lines.append('# TYPE ' + name + ' histogram')
+                    current = name
+                total = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    total += count
+                    lines.append(name + '_bucket' + label_text(labels, [('le', str(bound))]) + ' ' + str(total))
+                lines.append(name + '_bucket' + label_text(labels, [('le', '+Inf')]) + ' ' + str(histogram.count))
+                lines.append(name + '_sum' + label_text(labels) + ' ' + repr(histogram.sum))
+                lines.append(name + '_count' + label_text(labels) + ' ' + str(histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename):
+        with open(filename, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(self.to_prometheus() if filename.endswith(('.prom', '.txt')) else self.to_json())
+        return filename
+
+
+class Timer:
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed = perf_counter() - self.start
+        self.metrics.observe(self.name, self.elapsed, **self.labels)
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_labels(statement):
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    table = re.search(r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(\w+)', statement, re.IGNORECASE)
+    return operation, table.group(1).upper() if table else ''
+
+
+class MeteredCursor(sqlite3.Cursor):
+    labels = ('', '')
+
+    def timed(self, method, statement, *args):
+        self.labels = statement_labels(statement)
+        start = perf_counter()
+        try:
+            return method(statement, *args)
+        finally:
+            self.connection.metrics.observe('sqlite_query_seconds', perf_counter() - start,
+                                            operation=self.labels[0], table=self.labels[1])
+
+    def execute(self, statement, *args):
+        return self.timed(super().execute, statement, *args)
+
+    def executemany(self, statement, *args):
+        return self.timed(super().executemany, statement, *args)
+
+    def fetched(self, method, *args):
+        start = perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.connection.metrics.observe('sqlite_fetch_seconds', perf_counter() - start,
+                                            operation=self.labels[0], table=self.labels[1])
+
+    def fetchall(self):
+        return self.fetched(super().fetchall)
+
+    def fetchmany(self, size=None):
+        return self.fetched(super().fetchmany, self.arraysize if size is None else size)
+
+
+class MeteredConnection(sqlite3.Connection):
+    metrics = None
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = MeteredCursor if self.metrics is not None else sqlite3.Cursor
+        return super().cursor(factory)
+
+
+def run_profiled(function, *args, **kwargs):
+    profile_file = os.environ.get('MIXEDTAPER_PROFILE')
+    if not profile_file:
+        return function(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        profiler.dump_stats(profile_file)
+
+
+def write_from_env(metrics):
+    metrics_file = os.environ.get('MIXEDTAPER_METRICS')
+    if metrics_file:
+        metrics.write(metrics_file)
+
+
+registry = Metrics()
@@ -2,115 +2,285 @@ import json
 from simple_discogs import SimpleDiscogs
     
 import sys
-from PyQt5.QtWidgets import QApplication, QMainWindow, QTableWidgetItem, QFileDialog, QMessageBox
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication, QMainWindow, QTableWidgetItem, QFileDialog, QInputDialog, QMessageBox
 from mixed_taper_ui import Ui_MainWindow
-from datetime import datetime, timedelta
+from mixed_taper_models import RowTableModel, SideTableModel
+from mixed_taper_workers import ImageLoader, IndexBuilder, ReleaseRefresher, SearchWorker, TrackPrefetcher
+from tape_solver import TAPE_LENGTHS, fit_tape, tape_seconds
+from tape_export import EXPORTERS, export_tape
+from metrics import registry, run_profiled, write_from_env
+import similarity_index
+from datetime import datetime
+from os import path
+
+timed_slot = registry.timed('ui_handler_seconds')
+
 
 class Window(QMainWindow, Ui_MainWindow):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setupUi(self)
-        self.artist_list.cellClicked.connect(self.populate_release_list)
+        self.artist_model = RowTableModel([('ARTIST', 'name')], page_size=500, parent=self)
+        self.release_model = RowTableModel([('RELEASES', lambda release: '(' + str(release['YEAR']) + ') ' + release['TITLE'])],
+                                           decoration=lambda release: self.image_loader.pixmap(release['THUMB_URL']), parent=self)
+        self.track_model = RowTableModel([('POSITION', 'DISCOGS_RELEASE_TRACK'), ('LENGTH', 'LENGTH'), ('TITLE', 'TITLE')],
+                                         editable=True, parent=self)
+        self.side_a_model = SideTableModel(self)
+        self.side_b_model = SideTableModel(self)
+        self.suggestion_model = RowTableModel([('LENGTH', 'LENGTH'), ('ARTIST', 'ARTIST'), ('TITLE', 'TITLE')], parent=self)
+        self.artist_list.setModel(self.artist_model)
+        self.release_list.setModel(self.release_model)
+        self.track_list.setModel(self.track_model)
+        self.side_a_list.setModel(self.side_a_model)
+        self.side_b_list.setModel(self.side_b_model)
+        self.suggestion_list.setModel(self.suggestion_model)
+
+        self.artist_list.clicked.connect(self.populate_release_list)
         self.artist_list.keyPressed.connect(self.refresh_artists)
-        self.release_list.cellClicked.connect(self.populate_track_list)
-        self.track_list.cellDoubleClicked.connect(self.populate_side_a_list)
+        self.release_list.clicked.connect(self.populate_track_list)
+        self.track_list.doubleClicked.connect(self.populate_side_a_list)
+
+        self.side_a_list.doubleClicked.connect(self.remove_item_a)
+        self.side_a_model.rowsInserted.connect(lambda: self.resize_side_table(self.side_a_list))
+        self.side_a_model.total_changed.connect(lambda seconds: self.side_a_time_box.setText(self.sd.seconds_to_time(seconds)))
+
+        self.side_b_list.doubleClicked.connect(self.remove_item_b)
+        self.side_b_model.rowsInserted.connect(lambda: self.resize_side_table(self.side_b_list))
+        self.side_b_model.total_changed.connect(lambda seconds: self.side_b_time_box.setText(self.sd.seconds_to_time(seconds)))
 
-        self.side_a_list.cellDoubleClicked.connect(self.remove_item_a)
-        self.side_a_list.cellChanged.connect(lambda: self.resize_side_table(self.side_a_list))
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(lambda: self.searcher.search(self.search_box.text()))
+        self.search_box.textChanged.connect(self.search_timer.start)
+        self.search_results.cellDoubleClicked.connect(self.add_search_result)
 
-        self.side_b_list.cellDoubleClicked.connect(self.remove_item_b)
-        self.side_b_list.cellChanged.connect(lambda: self.resize_side_table(self.side_b_list))
+        self.suggestion_timer = QTimer(self)
+        self.suggestion_timer.setSingleShot(True)
+        self.suggestion_timer.setInterval(150)
+        self.suggestion_timer.timeout.connect(self.populate_suggestions)
+        self.side_a_model.total_changed.connect(self.suggestion_timer.start)
+        self.side_b_model.total_changed.connect(self.suggestion_timer.start)
+        self.tape_combo.currentTextChanged.connect(self.suggestion_timer.start)
+        self.suggestion_list.doubleClicked.connect(self.add_suggestion)
 
         self.calculate_button.clicked.connect(self.calculate_sides)
         self.save_button.clicked.connect(self.save_to_file)
+        self.load_button.clicked.connect(self.load_saved_tape)
         self.clear_button.clicked.connect(self.clear_tracks)
+        self.fit_button.clicked.connect(self.fit_sides)
+        self.add_selected_button.clicked.connect(self.populate_side_a_list)
+        self.add_release_button.clicked.connect(self.add_release)
+        self.move_to_b_button.clicked.connect(self.move_to_side_b)
+        self.move_to_a_button.clicked.connect(self.move_to_side_a)
+        self.fill_button.clicked.connect(self.fill_from_suggestions)
+        self.tape_combo.addItems(list(TAPE_LENGTHS))
+        self.tape_combo.setCurrentText('C60')
         
         self.tracker = {'ARTIST':'', 'RELEASES':[], 'RELEASE':{}, 'TRACKS':[]}
+        self.search_songs = []
         self.initialize_databases()
+        self.prefetcher = TrackPrefetcher(self.sd)
+        self.prefetcher.track_list_ready.connect(self.track_list_ready)
+        self.prefetcher.start()
+        self.searcher = SearchWorker(self.sd, self)
+        self.searcher.results_ready.connect(self.populate_search_results)
+        self.image_loader = ImageLoader(self.sd, icon_size=self.release_list.iconSize().width(), parent=self)
+        self.image_loader.image_ready.connect(lambda url: self.release_model.refresh_rows(lambda release: release['THUMB_URL'] == url))
         self.populate_artists_list()
+        self.refresher = ReleaseRefresher(self.sd, self)
+        self.refresher.refreshed.connect(self.merge_artists_list)
+        self.refresher.refreshed.connect(self.refresh_finished)
+        self.refresher.refresh_failed.connect(self.refresh_failed)
+        self.refresher.refreshed.connect(self.suggestion_timer.start)
+        self.index_builder = IndexBuilder(self.sd, self)
+        self.index_builder.index_ready.connect(self.suggestion_timer.start)
+        self.index_builder.index_failed.connect(self.suggestions_failed)
+        if self.background_refresh:
+            self.statusbar.showMessage('Checking Discogs for new releases...')
+            self.refresher.start()
+        if similarity_index.np is None:
+            self.suggestion_list.hide()
+            self.fill_button.hide()
+        else:
+            self.index_builder.start()
+
+    def closeEvent(self, event):
+        self.prefetcher.stop()
+        self.searcher.stop()
+        self.image_loader.stop()
+        super().closeEvent(event)
 
     def initialize_databases(self):
         with open('./simple_discogs.conf', 'r') as config_file:
             creds = json.loads(config_file.read())
-        self.sd = SimpleDiscogs(creds['discogs_user_id'], creds['discogs_user_token'], user_agent='MixedTaper/1.0')
+        self.background_refresh = creds.get('background_refresh', False)
+        self.sd = SimpleDiscogs(creds['discogs_user_id'], creds['discogs_user_token'], user_agent='MixedTaper/1.0',
+                                update_on_init=not self.background_refresh)
 
     def populate_artists_list(self):
-        self.artist_list.clearSelection()
-        self.artist_list.clearContents()
-        self.release_list.clearSelection()
-        self.release_list.clearContents()
-        self.track_list.clearSelection()
-        self.track_list.clearContents()
-        artists = self.sd.get_unique_list('ARTIST')
-        self.artist_list.setRowCount(len(artists))
-        for row, artist in enumerate(artists):
-            self.artist_list.setItem(row, 0, QTableWidgetItem(artist['name']))
-        self.artist_list.resizeRowsToContents()
+        self.release_model.set_rows([])
+        self.track_model.set_rows([])
+        self.artist_model.set_rows(self.sd.iter_unique_list('ARTIST'))
+
+    @timed_slot
+    def merge_artists_list(self):
+        selected = self.artist_model.rows[self.artist_list.currentIndex().row()]['name'] if self.artist_list.currentIndex().isValid() else None
+        scroll_position = self.artist_list.verticalScrollBar().value()
+        loaded = self.artist_model.rowCount()
+        self.artist_model.set_rows(self.sd.iter_unique_list('ARTIST'))
+        self.artist_model.fetch_rows(loaded)
+        for row, artist in enumerate(self.artist_model.rows):
+            if artist['name'] == selected:
+                self.artist_list.setCurrentIndex(self.artist_model.index(row, 0))
+                break
+        self.artist_list.verticalScrollBar().setValue(scroll_position)
     
+    def refresh_finished(self, added):
+        self.statusbar.showMessage('Added ' + str(added) + ' release(s) from Discogs.', 5000)
+
+    def refresh_failed(self, error):
+        self.statusbar.showMessage('Could not refresh from Discogs, showing the local library: ' + error)
+
+    def suggestions_failed(self, error):
+        self.suggestion_model.set_rows([])
+        self.statusbar.showMessage('Could not prepare track suggestions: ' + error)
+
+    @timed_slot
     def populate_release_list(self):
-        self.release_list.clearSelection()
-        self.release_list.clearContents()
         self.tracker = {'ARTIST':'', 'RELEASES':[], 'RELEASE':{}, 'TRACKS':[]}
-        self.tracker['ARTIST'] = self.artist_list.selectedItems()[0].text()
+        self.tracker['ARTIST'] = self.artist_model.rows[self.artist_list.currentIndex().row()]['name']
         self.tracker['RELEASES'] = self.sd.browse('ARTIST', self.tracker['ARTIST'])
-        self.release_list.setRowCount(len(self.tracker['RELEASES']))
-        for row, release in enumerate(self.tracker['RELEASES']):
-            self.release_list.setItem(row, 0, QTableWidgetItem('(' + str(release['YEAR']) + ') ' + release['TITLE']))
-        self.release_list.resizeRowsToContents()
-        self.release_list.item(0, 0).setSelected(True)
-        self.populate_track_list()
+        self.prefetcher.queue_releases([release['RELEASE_ID'] for release in self.tracker['RELEASES']])
+        self.release_model.set_rows(self.tracker['RELEASES'])
+        self.track_model.set_rows([])
+        if self.tracker['RELEASES']:
+            self.release_list.selectRow(0)
+            self.populate_track_list()
 
+    @timed_slot
     def populate_track_list(self):
-        self.track_list.clearSelection()
-        self.track_list.clearContents()
         row_index = self.release_list.selectionModel().selectedRows()[0].row()
         release = self.sd.get_release(self.tracker['RELEASES'][row_index]['RELEASE_ID'])
         tracks = self.sd.query_songs(discogs_release_id=release['RELEASE_ID'])
         if tracks == []:
-            _ = self.sd.get_track_list(release['RELEASE_ID'])
-            tracks = self.sd.query_songs(discogs_release_id=release['RELEASE_ID'])
-        self.track_list.setRowCount(len(tracks))
-        for row, track in enumerate(tracks):
-            self.track_list.setItem(row, 0, QTableWidgetItem(track['DISCOGS_RELEASE_TRACK']))
-            self.track_list.setItem(row, 1, QTableWidgetItem(track['LENGTH']))
-            self.track_list.setItem(row, 2, QTableWidgetItem(track['TITLE']))
-        
-        self.track_list.resizeRowsToContents()
+            self.prefetcher.prioritize(release['RELEASE_ID'])
+        self.track_model.set_rows(tracks)
         self.track_list.resizeColumnToContents(0)
         self.track_list.resizeColumnToContents(1)
         self.tracker['RELEASE'] = release
         self.tracker['TRACKS'] = tracks
+
+    @timed_slot
+    def track_list_ready(self, release_id):
+        if self.tracker['RELEASE'] and self.tracker['RELEASE']['RELEASE_ID'] == release_id and self.tracker['TRACKS'] == []:
+            self.populate_track_list()
     
+    @timed_slot
+    def populate_search_results(self, text, songs):
+        if text != self.search_box.text():
+            return
+        self.search_results.clearSelection()
+        self.search_results.clearContents()
+        self.search_songs = songs
+        self.search_results.setRowCount(len(self.search_songs))
+        for row, song in enumerate(self.search_songs):
+            self.search_results.setItem(row, 0, QTableWidgetItem(song['LENGTH']))
+            self.search_results.setItem(row, 1, QTableWidgetItem(song['ARTIST']))
+            self.search_results.setItem(row, 2, QTableWidgetItem(song['TITLE']))
+        self.search_results.resizeColumnToContents(0)
+        self.search_results.resizeColumnToContents(1)
+
+    @timed_slot
+    def add_search_result(self, row_index):
+        self.side_a_model.append_track(self.search_songs[row_index])
+
+    def suggestion_target(self):
+        side_length = tape_seconds(self.tape_combo.currentText()) // 2
+        if self.side_b_model.rows or self.side_a_model.playlist.total_seconds >= side_length:
+            model = self.side_b_model
+        else:
+            model = self.side_a_model
+        seeds = [track['SONG_ID'] for track in self.side_a_model.rows + self.side_b_model.rows if track['SONG_ID']]
+        return model, seeds[-1] if seeds else None, side_length - model.playlist.total_seconds
+
+    def tape_song_ids(self):
+        return list(self.side_a_model.playlist.song_ids) + list(self.side_b_model.playlist.song_ids)
+
+    def suggestions_available(self):
+        return self.sd.similarity_index is not None and self.sd.similarity_index.is_available()
+
+    @timed_slot
+    def populate_suggestions(self):
+        model, seed, remaining = self.suggestion_target()
+        if similarity_index.np is None or seed is None or remaining <= 0:
+            self.suggestion_model.set_rows([])
+            return
+        if not self.suggestions_available():
+            return
+        self.suggestion_model.set_rows(self.sd.suggest_tracks(seed, remaining, self.tape_song_ids()))
+        self.suggestion_list.resizeColumnToContents(0)
+        self.suggestion_list.resizeColumnToContents(1)
+
+    @timed_slot
+    def add_suggestion(self, index):
+        model = self.suggestion_target()[0]
+        model.append_track(self.suggestion_model.rows[index.row()])
+
+    @timed_slot
+    def fill_from_suggestions(self):
+        model, seed, remaining = self.suggestion_target()
+        if similarity_index.np is None or seed is None or remaining <= 0:
+            return
+        if not self.suggestions_available():
+            if self.index_builder.error:
+                self.statusbar.showMessage('Track suggestions are unavailable: ' + self.index_builder.error, 5000)
+            else:
+                self.statusbar.showMessage('Suggestions are still being prepared, try again in a moment.', 5000)
+            return
+        model.insert_tracks(len(model.rows), self.sd.fill_suggestions(seed, remaining, self.tape_song_ids()))
+
+    def release_tracks(self, rows):
+        return [dict(self.track_model.rows[row], ARTIST=self.tracker['ARTIST'], RELEASE=self.tracker['RELEASE']['TITLE']) for row in rows]
+
+    @timed_slot
     def populate_side_a_list(self):
-        row_index = self.track_list.selectionModel().selectedRows()[0].row()
-
-        release_id = release = self.tracker['RELEASE']['RELEASE_ID']
-        artist = self.tracker['ARTIST']
-        release = self.tracker['RELEASE']['TITLE']
-        position = self.tracker['TRACKS'][row_index]['DISCOGS_RELEASE_TRACK']
-        title = self.tracker['TRACKS'][row_index]['TITLE']
-        duration = self.tracker['TRACKS'][row_index]['LENGTH']
-        self.side_a_list.setRowCount(self.side_a_list.rowCount()+1)
-        new_row = self.side_a_list.rowCount()-1
-        self.side_a_list.setItem(new_row, 0, QTableWidgetItem(release))
-        self.side_a_list.setItem(new_row, 1, QTableWidgetItem(artist))
-        self.side_a_list.setItem(new_row, 2, QTableWidgetItem(position))
-        self.side_a_list.setItem(new_row, 3, QTableWidgetItem(duration))
-        self.side_a_list.setItem(new_row, 4, QTableWidgetItem(title))
+        rows = sorted(index.row() for index in self.track_list.selectionModel().selectedRows())
+        self.side_a_model.insert_tracks(len(self.side_a_model.rows), self.release_tracks(rows))
+
+    @timed_slot
+    def add_release(self):
+        self.track_model.fetch_rows()
+        self.side_a_model.insert_tracks(len(self.side_a_model.rows), self.release_tracks(range(len(self.track_model.rows))))
+
+    def move_selected(self, source_list, target_model):
+        rows = [index.row() for index in source_list.selectionModel().selectedRows()]
+        target_model.insert_tracks(len(target_model.rows), source_list.model().take_rows(rows))
+
+    @timed_slot
+    def move_to_side_b(self):
+        self.move_selected(self.side_a_list, self.side_b_model)
+
+    @timed_slot
+    def move_to_side_a(self):
+        self.move_selected(self.side_b_list, self.side_a_model)
         
+    @timed_slot
     def clear_tracks(self):
-        self.side_a_list.clearSelection()
-        self.side_a_list.clearContents()
-        self.side_b_list.clearSelection()
-        self.side_b_list.clearContents()
+        self.side_a_model.set_rows([])
+        self.side_b_model.set_rows([])
         
     def resize_side_table(self, table):
-        table.resizeRowsToContents()
         table.resizeColumnToContents(0)
         table.resizeColumnToContents(1)
     
+    @timed_slot
     def refresh_artists(self, key):
         if key == 16777268: # F5
+            if self.refresher.is_running():
+                self.statusbar.showMessage('Discogs is already being checked in the background, the artists update when it finishes.', 5000)
+                return
             msg = QMessageBox()
             msg.setIcon(QMessageBox.Information)
             msg.setText("Refreshing the artist list from Discogs will take a little time, depending on the size of the collection.")
@@ -124,64 +294,66 @@ class Window(QMainWindow, Ui_MainWindow):
                 msg.setStandardButtons(QMessageBox.Ok)
                 msg.exec_()
 
+    @timed_slot
     def save_to_file(self):
-        filename, _ = QFileDialog.getSaveFileName(self,caption='Save Track List', directory='.',  filter='Simple Text (*.txt);;Spreadsheet (*.csv)')
+        filters = {'Simple Text (*.txt)': 'txt', 'Spreadsheet (*.csv)': 'csv', 'Playlist (*.m3u)': 'm3u', 'JSON (*.json)': 'json'}
+        filename, selected_filter = QFileDialog.getSaveFileName(self,caption='Save Track List', directory='.',  filter=';;'.join(filters))
         if filename is None or filename == '':
             return None
-        side = 'A'
-        csv_file_contents = 'SIDE,TRACK NO,TIME,TITLE,ARTIST,RELEASE\n'
-        text_file_contents = ''
-        for table in [self.side_a_list, self.side_b_list]:
-            text_file_contents += 'SIDE ' + side + '\n'
-            for row in list(range(0, table.rowCount())):
-                duration = table.item(row, 3).text()
-                if duration == '':
-                    duration = '00:00:00'
-                txt_row_list = '\t'.join([str(row+1), table.item(row, 3).text(), table.item(row, 4).text() + ' - ' + table.item(row, 1).text() + ' [' + table.item(row, 0).text() + ']'])
-                csv_row_list = ','.join([side, str(row+1), table.item(row, 3).text(), '"'+table.item(row, 4).text()+'"', '"'+table.item(row, 1).text()+'"', '"'+table.item(row, 0).text()+'"'])
-                text_file_contents += '\t' + txt_row_list + '\n'
-                csv_file_contents += csv_row_list + '\n'
-            side = 'B'
-        with open(filename, 'w', encoding='utf-8') as out_file:
-            if filename.endswith('csv'):
-                out_file.write(csv_file_contents)
-            else:
-                out_file.write(text_file_contents)
+        if path.splitext(filename)[1][1:].lower() not in EXPORTERS:
+            filename += '.' + filters.get(selected_filter, 'txt')
+        tape = self.current_tape(path.splitext(path.basename(filename))[0])
+        self.sd.save_tape(tape['NAME'], tape['SIDES'], tape['TAPE_LENGTH'])
+        export_tape(tape, filename)
 
+    def current_tape(self, name):
+        return {'NAME': name, 'TAPE_LENGTH': self.tape_combo.currentText(),
+                'SIDES': {'A': list(self.side_a_model.rows), 'B': list(self.side_b_model.rows)}}
+
+    @timed_slot
+    def load_saved_tape(self):
+        tapes = self.sd.list_tapes()
+        if not tapes:
+            QMessageBox.information(self, 'Load Tape', 'There are no saved tapes yet. Use SAVE to store the current tape.')
+            return None
+        names = [tape['NAME'] + ' (' + str(tape['TRACK_COUNT']) + ' tracks, ' + self.sd.seconds_to_time(tape['SECONDS']) + ')' for tape in tapes]
+        name, accepted = QInputDialog.getItem(self, 'Load Tape', 'Saved tapes:', names, 0, False)
+        if not accepted:
+            return None
+        tape = self.sd.load_tape(tapes[names.index(name)]['TAPE_ID'])
+        if tape['TAPE_LENGTH'] in TAPE_LENGTHS:
+            self.tape_combo.setCurrentText(tape['TAPE_LENGTH'])
+        self.side_a_model.set_rows(tape['SIDES']['A'])
+        self.side_b_model.set_rows(tape['SIDES']['B'])
+        return tape
+
+    @timed_slot
     def calculate_sides(self):       
-        side_stats = [{'side':'A', 'table':self.side_a_list, 'tracks':[]}, {'side':'B', 'table':self.side_b_list, 'tracks':[]}]
-        for entry in side_stats:
-            for row in list(range(0, entry['table'].rowCount())):
-                entry['tracks'].append({'artist':entry['table'].item(row, 1).text(), 'release':entry['table'].item(row, 0).text(), 
-                                        'orig_position':entry['table'].item(row, 2).text(), 'duration':entry['table'].item(row, 3).text(), 
-                                        'title':entry['table'].item(row, 4).text(), 'new_position':row+1})
-            total_time = timedelta(hours=0, minutes=0, seconds=0)
-            for track in entry['tracks']:
-                if track['duration'].count(':') == 2:
-                    hrs, mts, sec = track['duration'].split(':')
-                elif track['duration'].count(':') == 1:
-                    mts, sec = track['duration'].split(':')
-                    hrs = 0
-                else:
-                    hrs = 0
-                    mts = 0
-                    sec = 0
-                total_time += timedelta(hours=int(hrs), minutes=int(mts), seconds=int(sec))
-            total_time = str(total_time)
-            if len(total_time.split(':')[0]) == 1:
-                total_time = '0' + total_time
-            entry['total_time'] = str(total_time)
-            entry['track_count'] = len(entry['tracks'])
-        self.side_a_time_box.setText(side_stats[0]['total_time'])
-        self.side_b_time_box.setText(side_stats[1]['total_time'])
-            
-    def remove_item_a(self):
-        index = self.side_a_list.selectionModel().selectedRows()[0].row()
-        self.side_a_list.removeRow(index)
-
-    def remove_item_b(self):
-        index = self.side_b_list.selectionModel().selectedRows()[0].row()
-        self.side_b_list.removeRow(index)
+        self.side_a_time_box.setText(self.side_a_model.playlist.total_time())
+        self.side_b_time_box.setText(self.side_b_model.playlist.total_time())
+
+    @timed_slot
+    def fit_sides(self):
+        tracks = [dict(track) for track in self.side_a_model.rows + self.side_b_model.rows]
+        if not tracks:
+            return
+        fit = fit_tape(tracks, self.tape_combo.currentText(), keep_album_order=self.album_order_check.isChecked())
+        self.side_a_model.set_rows(fit['sides']['A'])
+        self.side_b_model.set_rows(fit['sides']['B'])
+        if fit['unused']:
+            msg = QMessageBox()
+            msg.setIcon(QMessageBox.Information)
+            msg.setWindowTitle("Fit Tape")
+            msg.setText(str(len(fit['unused'])) + " track(s) did not fit on a " + self.tape_combo.currentText() + " tape and were removed.")
+            msg.exec_()
+
+    @timed_slot
+    def remove_item_a(self, index):
+        self.side_a_model.removeRows(index.row(), 1)
+
+    @timed_slot
+    def remove_item_b(self, index):
+        self.side_b_model.removeRows(index.row(), 1)
     
 
 
@@ -189,4 +361,6 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     win = Window()
     win.show()
-    sys.exit(app.exec())
+    exit_code = run_profiled(app.exec)
+    write_from_env(registry)
+    sys.exit(exit_code)
@@ -0,0 +1,172 @@
+import json
+from itertools import groupby, islice
+
+from PyQt5.QtCore import QAbstractTableModel, QMimeData, QModelIndex, Qt, pyqtSignal
+
+from playlist import Playlist
+
+
+class RowTableModel(QAbstractTableModel):
+    def __init__(self, columns, page_size=200, editable=False, decoration=None, parent=None):
+        super().__init__(parent)
+        self.columns = columns
+        self.page_size = page_size
+        self.editable = editable
+        self.decoration = decoration
+        self.rows = []
+        self.source = None
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = []
+        self.source = iter(rows)
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def fetch_rows(self, count=None):
+        while (count is None or len(self.rows) < count) and self.canFetchMore(QModelIndex()):
+            self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.source is not None
+
+    def fetchMore(self, parent):
+        if not self.canFetchMore(parent):
+            return
+        rows = list(islice(self.source, self.page_size))
+        if len(rows) < self.page_size:
+            self.source = None
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            key = self.columns[index.column()][1]
+            value = key(row) if callable(key) else row.get(key)
+            return '' if value is None else str(value)
+        if role == Qt.DecorationRole and self.decoration is not None and index.column() == 0:
+            return self.decoration(row)
+        if role == Qt.UserRole:
+            return row
+        return None
+
+    def refresh_rows(self, predicate):
+        for row_index, row in enumerate(self.rows):
+            if predicate(row):
+                self.dataChanged.emit(self.index(row_index, 0), self.index(row_index, len(self.columns) - 1))
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole or callable(self.columns[index.column()][1]):
+            return False
+        key = self.columns[index.column()][1]
+        self.rows[index.row()][key] = value
+        self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+        return True
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section][0]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if self.editable and index.isValid():
+            flags |= Qt.ItemIsEditable
+        return flags
+
+
+class SideTableModel(RowTableModel):
+    mime_type = 'application/x-mixedtaper-tracks'
+    total_changed = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__([('RELEASE', 'RELEASE'), ('ARTIST', 'ARTIST'), ('POSITION', 'DISCOGS_RELEASE_TRACK'),
+                          ('LENGTH', 'LENGTH'), ('TITLE', 'TITLE')], editable=True, parent=parent)
+        self.playlist = Playlist()
+        self.rows = self.playlist.tracks
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.playlist.clear()
+        self.playlist.insert(0, rows)
+        self.endResetModel()
+        self.total_changed.emit(self.playlist.total_seconds)
+
+    def append_track(self, track):
+        self.insert_tracks(len(self.rows), [track])
+
+    def insert_tracks(self, row, tracks):
+        if not tracks:
+            return
+        self.beginInsertRows(QModelIndex(), row, row + len(tracks) - 1)
+        self.playlist.insert(row, tracks)
+        self.endInsertRows()
+        self.total_changed.emit(self.playlist.total_seconds)
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if parent.isValid() or count <= 0 or row < 0 or row + count > len(self.rows):
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+        self.playlist.remove(row, count)
+        self.endRemoveRows()
+        self.total_changed.emit(self.playlist.total_seconds)
+        return True
+
+    def take_rows(self, rows):
+        rows = sorted(set(row for row in rows if 0 <= row < len(self.rows)))
+        tracks = [self.rows[row] for row in rows]
+        ranges = [[row for _, row in group] for _, group in groupby(enumerate(rows), lambda pair: pair[1] - pair[0])]
+        for block in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), block[0], block[-1])
+            self.playlist.remove(block[0], len(block))
+            self.endRemoveRows()
+        if tracks:
+            self.total_changed.emit(self.playlist.total_seconds)
+        return tracks
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if index.isValid() and role == Qt.EditRole and self.columns[index.column()][1] == 'LENGTH':
+            self.playlist.set_length(index.row(), value)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+            self.total_changed.emit(self.playlist.total_seconds)
+            return True
+        return super().setData(index, value, role)
+
+    def flags(self, index):
+        flags = super().flags(index) | Qt.ItemIsDropEnabled
+        if index.isValid():
+            flags |= Qt.ItemIsDragEnabled
+        return flags
+
+    def supportedDropActions(self):
+        return Qt.MoveAction | Qt.CopyAction
+
+    def mimeTypes(self):
+        return [self.mime_type]
+
+    def mimeData(self, indexes):
+        rows = sorted(set(index.row() for index in indexes))
+        mime_data = QMimeData()
+        mime_data.setData(self.mime_type, json.dumps([self.rows[row] for row in rows]).encode('utf-8'))
+        return mime_data
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if action == Qt.IgnoreAction:
+            return True
+        if not data.hasFormat(self.mime_type):
+            return False
+        if row == -1:
+            row = parent.row() if parent.isValid() else len(self.rows)
+        self.insert_tracks(row, json.loads(bytes(data.data(self.mime_type)).decode('utf-8')))
+        return True
@@ -1,18 +1,17 @@
 # pyuic5 -o mixed_taper_template_ui.py mixed_taper_template.ui
 
 from PyQt5 import QtCore, QtGui, QtWidgets
-from PyQt5.QtWidgets import QTableWidgetItem, QTableWidget, QAbstractItemView
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QDropEvent
+from PyQt5.QtWidgets import QTableView, QAbstractItemView
 
-class TableWidgetRefresh(QTableWidget):
+class TableViewRefresh(QTableView):
     keyPressed = QtCore.pyqtSignal(int)
 
     def keyPressEvent(self, event):
-        super(TableWidgetRefresh, self).keyPressEvent(event)
+        super(TableViewRefresh, self).keyPressEvent(event)
         self.keyPressed.emit(event.key())
 
-class TableWidgetDragRows(QTableWidget):
+
+class TableViewDragRows(QTableView):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -26,106 +25,96 @@ class TableWidgetDragRows(QTableWidget):
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.setDragDropMode(QAbstractItemView.DragDrop)
 
-    def dropEvent(self, event: QDropEvent):
-        if not event.isAccepted() and event.source() == self:
-            drop_row = self.drop_on(event)
-            rows = sorted(set(item.row() for item in self.selectedItems()))
-            rows_to_move = [[QTableWidgetItem(self.item(row_index, column_index)) for column_index in range(self.columnCount())]
-                            for row_index in rows]
-            for row_index in reversed(rows):
-                self.removeRow(row_index)
-                if row_index < drop_row:
-                    drop_row -= 1
-            for row_index, data in enumerate(rows_to_move):
-                row_index += drop_row
-                self.insertRow(row_index)
-                for column_index, column_data in enumerate(data):
-                    self.setItem(row_index, column_index, column_data)
-            event.accept()
-            for row_index in range(len(rows_to_move)):
-                self.item(drop_row + row_index, 0).setSelected(True)
-                self.item(drop_row + row_index, 1).setSelected(True)
-        super().dropEvent(event)
-
-    def drop_on(self, event):
-        index = self.indexAt(event.pos())
-        if not index.isValid():
-            return self.rowCount()
-        return index.row() + 1 if self.is_below(event.pos(), index) else index.row()
-
-    def is_below(self, pos, index):
-        rect = self.visualRect(index)
-        margin = 2
-        if pos.y() - rect.top() < margin:
-            return False
-        elif rect.bottom() - pos.y() < margin:
-            return True
-        return rect.contains(pos, True) and not (int(self.model().flags(index)) & Qt.ItemIsDropEnabled) and pos.y() >= rect.center().y()
+
+def set_uniform_rows(table, height=22):
+    table.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+    table.verticalHeader().setDefaultSectionSize(height)
+
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
         MainWindow.setObjectName("MainWindow")
-        MainWindow.resize(1600, 800)
+        MainWindow.resize(1600, 826)
         sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed)
         sizePolicy.setHorizontalStretch(0)
         sizePolicy.setVerticalStretch(0)
         sizePolicy.setHeightForWidth(MainWindow.sizePolicy().hasHeightForWidth())
         MainWindow.setSizePolicy(sizePolicy)
-        MainWindow.setMinimumSize(QtCore.QSize(1600, 800))
-        MainWindow.setMaximumSize(QtCore.QSize(1600, 800))
+        MainWindow.setMinimumSize(QtCore.QSize(1600, 826))
+        MainWindow.setMaximumSize(QtCore.QSize(1600, 826))
         self.centralwidget = QtWidgets.QWidget(MainWindow)
         self.centralwidget.setObjectName("centralwidget")
 
-        self.artist_list = TableWidgetRefresh(self.centralwidget)
+        self.artist_list = TableViewRefresh(self.centralwidget)
         self.artist_list.setGeometry(QtCore.QRect(0, 0, 301, 801))
         self.artist_list.setFrameShadow(QtWidgets.QFrame.Sunken)
         self.artist_list.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.artist_list.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
-        self.artist_list.setRowCount(0)
-        self.artist_list.setColumnCount(1)
-        self.artist_list.setHorizontalHeaderLabels(['ARTIST'])
+        self.artist_list.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.artist_list.setObjectName("artist_list")
         self.artist_list.horizontalHeader().setStretchLastSection(True)
+        set_uniform_rows(self.artist_list)
 
-        self.release_list = QtWidgets.QTableWidget(self.centralwidget)
+        self.release_list = QtWidgets.QTableView(self.centralwidget)
         self.release_list.setGeometry(QtCore.QRect(300, 0, 361, 261))
         self.release_list.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.release_list.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.release_list.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.release_list.setObjectName("release_list")
-        self.release_list.setColumnCount(1)
-        self.release_list.setHorizontalHeaderLabels(['RELEASES'])
-        self.release_list.setRowCount(0)
         self.release_list.horizontalHeader().setStretchLastSection(True)
+        self.release_list.setIconSize(QtCore.QSize(32, 32))
+        set_uniform_rows(self.release_list, 36)
 
-        self.track_list = QtWidgets.QTableWidget(self.centralwidget)
-        self.track_list.setGeometry(QtCore.QRect(300, 260, 361, 541))
+        self.track_list = QtWidgets.QTableView(self.centralwidget)
+        self.track_list.setGeometry(QtCore.QRect(300, 260, 361, 511))
         self.track_list.setEditTriggers(QtWidgets.QAbstractItemView.SelectedClicked)
         self.track_list.setDragEnabled(False)
-        self.track_list.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.track_list.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
         self.track_list.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
         self.track_list.setObjectName("track_list")
-        self.track_list.setColumnCount(3)
-        self.track_list.setHorizontalHeaderLabels(['POSITION', 'LENGTH', 'TITLE'])
-        self.track_list.setRowCount(0)
         self.track_list.horizontalHeader().setStretchLastSection(True)
+        set_uniform_rows(self.track_list)
 
-        self.side_a_list = TableWidgetDragRows(self.centralwidget)
+        self.side_a_list = TableViewDragRows(self.centralwidget)
         self.side_a_list.setGeometry(QtCore.QRect(670, 0, 651, 401))
         self.side_a_list.setObjectName("side_a_list")
         self.side_a_list.setEditTriggers(QtWidgets.QAbstractItemView.SelectedClicked)
-        self.side_a_list.setColumnCount(5)
-        self.side_a_list.setHorizontalHeaderLabels(['RELEASE', 'ARTIST', 'POSITION', 'LENGTH', 'TITLE'])
-        self.side_a_list.setRowCount(0)
         self.side_a_list.horizontalHeader().setStretchLastSection(True)
+        set_uniform_rows(self.side_a_list)
 
-        self.side_b_list = TableWidgetDragRows(self.centralwidget)
+        self.side_b_list = TableViewDragRows(self.centralwidget)
         self.side_b_list.setGeometry(QtCore.QRect(670, 400, 651, 401))
         self.side_b_list.setObjectName("side_b_list")
         self.side_b_list.setEditTriggers(QtWidgets.QAbstractItemView.SelectedClicked)
-        self.side_b_list.setColumnCount(5)
-        self.side_b_list.setHorizontalHeaderLabels(['RELEASE', 'ARTIST', 'POSITION', 'LENGTH', 'TITLE'])
-        self.side_b_list.setRowCount(0)
         self.side_b_list.horizontalHeader().setStretchLastSection(True)
+        set_uniform_rows(self.side_b_list)
+
+        self.search_box = QtWidgets.QLineEdit(self.centralwidget)
+        self.search_box.setGeometry(QtCore.QRect(1330, 280, 261, 24))
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.setObjectName("search_box")
+
+        self.search_results = QtWidgets.QTableWidget(self.centralwidget)
+        self.search_results.setGeometry(QtCore.QRect(1330, 305, 261, 215))
+        self.search_results.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.search_results.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.search_results.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.search_results.setObjectName("search_results")
+        self.search_results.setColumnCount(3)
+        self.search_results.setHorizontalHeaderLabels(['LENGTH', 'ARTIST', 'TITLE'])
+        self.search_results.setRowCount(0)
+        self.search_results.verticalHeader().setVisible(False)
+        self.search_results.horizontalHeader().setStretchLastSection(True)
+
+        self.suggestion_list = QtWidgets.QTableView(self.centralwidget)
+        self.suggestion_list.setGeometry(QtCore.QRect(1330, 530, 261, 158))
+        self.suggestion_list.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.suggestion_list.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.suggestion_list.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.suggestion_list.setObjectName("suggestion_list")
+        self.suggestion_list.verticalHeader().setVisible(False)
+        self.suggestion_list.horizontalHeader().setStretchLastSection(True)
+        set_uniform_rows(self.suggestion_list)
 
         self.calculate_button = QtWidgets.QPushButton(self.centralwidget)
         self.calculate_button.setGeometry(QtCore.QRect(1400, 20, 121, 23))
@@ -138,7 +127,7 @@ class Ui_MainWindow(object):
         self.calculate_button.setObjectName("calculate_button")
 
         self.save_button = QtWidgets.QPushButton(self.centralwidget)
-        self.save_button.setGeometry(QtCore.QRect(1400, 210, 121, 23))
+        self.save_button.setGeometry(QtCore.QRect(1350, 210, 105, 23))
         font = QtGui.QFont()
         font.setFamily("Arial Black")
         font.setPointSize(12)
@@ -147,6 +136,49 @@ class Ui_MainWindow(object):
         self.save_button.setFont(font)
         self.save_button.setObjectName("save_button")
 
+        self.load_button = QtWidgets.QPushButton(self.centralwidget)
+        self.load_button.setGeometry(QtCore.QRect(1466, 210, 105, 23))
+        self.load_button.setFont(font)
+        self.load_button.setObjectName("load_button")
+
+        self.tape_combo = QtWidgets.QComboBox(self.centralwidget)
+        self.tape_combo.setGeometry(QtCore.QRect(1350, 245, 71, 23))
+        self.tape_combo.setObjectName("tape_combo")
+
+        self.album_order_check = QtWidgets.QCheckBox(self.centralwidget)
+        self.album_order_check.setGeometry(QtCore.QRect(1430, 245, 61, 23))
+        self.album_order_check.setObjectName("album_order_check")
+
+        self.fit_button = QtWidgets.QPushButton(self.centralwidget)
+        self.fit_button.setGeometry(QtCore.QRect(1500, 245, 71, 23))
+        self.fit_button.setFont(font)
+        self.fit_button.setObjectName("fit_button")
+
+        self.add_selected_button = QtWidgets.QPushButton(self.centralwidget)
+        self.add_selected_button.setGeometry(QtCore.QRect(300, 775, 178, 23))
+        self.add_selected_button.setFont(font)
+        self.add_selected_button.setObjectName("add_selected_button")
+
+        self.add_release_button = QtWidgets.QPushButton(self.centralwidget)
+        self.add_release_button.setGeometry(QtCore.QRect(483, 775, 178, 23))
+        self.add_release_button.setFont(font)
+        self.add_release_button.setObjectName("add_release_button")
+
+        self.move_to_b_button = QtWidgets.QPushButton(self.centralwidget)
+        self.move_to_b_button.setGeometry(QtCore.QRect(1350, 725, 105, 23))
+        self.move_to_b_button.setFont(font)
+        self.move_to_b_button.setObjectName("move_to_b_button")
+
+        self.move_to_a_button = QtWidgets.QPushButton(self.centralwidget)
+        self.move_to_a_button.setGeometry(QtCore.QRect(1466, 725, 105, 23))
+        self.move_to_a_button.setFont(font)
+        self.move_to_a_button.setObjectName("move_to_a_button")
+
+        self.fill_button = QtWidgets.QPushButton(self.centralwidget)
+        self.fill_button.setGeometry(QtCore.QRect(1400, 693, 121, 23))
+        self.fill_button.setFont(font)
+        self.fill_button.setObjectName("fill_button")
+
         self.clear_button = QtWidgets.QPushButton(self.centralwidget)
         self.clear_button.setGeometry(QtCore.QRect(1400, 760, 121, 23))
         self.clear_button.setFont(font)
@@ -201,6 +233,9 @@ class Ui_MainWindow(object):
         self.side_b_time_box.setObjectName("side_b_time_box")
 
         MainWindow.setCentralWidget(self.centralwidget)
+        self.statusbar = QtWidgets.QStatusBar(MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        MainWindow.setStatusBar(self.statusbar)
 
         self.retranslateUi(MainWindow)
         QtCore.QMetaObject.connectSlotsByName(MainWindow)
@@ -210,10 +245,26 @@ class Ui_MainWindow(object):
         MainWindow.setWindowTitle(_translate("MainWindow", "MixedTaper"))
         self.calculate_button.setText(_translate("MainWindow", "CALCULATE"))
         self.save_button.setText(_translate("MainWindow", "SAVE"))
+        self.load_button.setText(_translate("MainWindow", "LOAD"))
         self.clear_button.setText(_translate("MainWindow", "CLEAR"))
+        self.add_selected_button.setText(_translate("MainWindow", "ADD TRACKS"))
+        self.add_selected_button.setToolTip(_translate("MainWindow", "Add the selected tracks to Side A"))
+        self.add_release_button.setText(_translate("MainWindow", "ADD RELEASE"))
+        self.add_release_button.setToolTip(_translate("MainWindow", "Add every track of the release to Side A"))
+        self.move_to_b_button.setText(_translate("MainWindow", "A > B"))
+        self.move_to_b_button.setToolTip(_translate("MainWindow", "Move the selected Side A tracks to Side B"))
+        self.move_to_a_button.setText(_translate("MainWindow", "B > A"))
+        self.move_to_a_button.setToolTip(_translate("MainWindow", "Move the selected Side B tracks to Side A"))
+        self.fill_button.setText(_translate("MainWindow", "FILL SIDE"))
+        self.fill_button.setToolTip(_translate("MainWindow", "Fill the rest of the side with suggested tracks"))
+        self.suggestion_list.setToolTip(_translate("MainWindow", "Tracks similar to the last one on the side that still fit"))
+        self.fit_button.setText(_translate("MainWindow", "FIT"))
+        self.album_order_check.setText(_translate("MainWindow", "Album"))
+        self.album_order_check.setToolTip(_translate("MainWindow", "Keep tracks from the same release in album order"))
         self.side_a_group_box.setTitle(_translate("MainWindow", "Side A"))
         self.side_a_time_label.setText(_translate("MainWindow", "Total Time:"))
         self.side_a_time_box.setText(_translate("MainWindow", "00:00:00"))
         self.side_b_group_box.setTitle(_translate("MainWindow", "Side B"))
         self.side_b_time_label.setText(_translate("MainWindow", "Total Time:"))
         self.side_b_time_box.setText(_translate("MainWindow", "00:00:00"))
+        self.search_box.setPlaceholderText(_translate("MainWindow", "Search tracks..."))
@@ -0,0 +1,240 @@
+import re
+import threading
+from collections import OrderedDict, deque
+
+from PyQt5.QtCore import QObject, QThread, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+
+class TrackPrefetcher(QThread):
+    track_list_ready = pyqtSignal(int)
+
+    def __init__(self, sd, parent=None):
+        super().__init__(parent)
+        self.sd = sd
+        self.pending = deque()
+        self.prefetched = set()
+        self.condition = threading.Condition()
+
+    def queue_releases(self, release_ids):
+        with self.condition:
+            self.pending = deque(release_id for release_id in release_ids if release_id not in self.prefetched)
+            self.condition.notify()
+
+    def prioritize(self, release_id):
+        with self.condition:
+            if release_id in self.prefetched:
+                return False
+            if release_id in self.pending:
+                self.pending.remove(release_id)
+            self.pending.appendleft(release_id)
+            self.condition.notify()
+            return True
+
+    def stop(self):
+        self.requestInterruption()
+        with self.condition:
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            with self.condition:
+                while not self.pending and not self.isInterruptionRequested():
+                    self.condition.wait()
+                if self.isInterruptionRequested():
+                    return
+                release_id = self.pending.popleft()
+            try:
+                self.sd.get_track_list(release_id)
+            except Exception:
+                continue
+            with self.condition:
+                self.prefetched.add(release_id)
+            self.track_list_ready.emit(release_id)
+
+
+def error_message(error, secret=None):
+    response = getattr(error, 'response', None)
+    if response is not None:
+        return type(error).__name__ + ' (HTTP ' + str(response.status_code) + ')'
+    message = re.sub(r'\?[^\s\'"()]*', '', str(error))
+    if secret:
+        message = message.replace(secret, '***')
+    return type(error).__name__ + ': ' + message if message else type(error).__name__
+
+
+class ReleaseRefresher(QObject):
+    refreshed = pyqtSignal(int)
+    refresh_failed = pyqtSignal(str)
+
+    def __init__(self, sd, parent=None):
+        super().__init__(parent)
+        self.sd = sd
+        self.worker = None
+
+    def is_running(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return False
+        self.worker = threading.Thread(target=self.run, name='release-refresh', daemon=True)
+        self.worker.start()
+        return True
+
+    def run(self):
+        try:
+            added = self.sd.update_releases()
+        except Exception as error:
+            self.refresh_failed.emit(error_message(error, self.sd.discogs_user_token))
+            return
+        self.refreshed.emit(added)
+
+
+class IndexBuilder(QObject):
+    index_ready = pyqtSignal()
+    index_failed = pyqtSignal(str)
+
+    def __init__(self, sd, parent=None):
+        super().__init__(parent)
+        self.sd = sd
+        self.worker = None
+        self.error = None
+
+    def is_running(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return False
+        self.error = None
+        self.worker = threading.Thread(target=self.run, name='similarity-index', daemon=True)
+        self.worker.start()
+        return True
+
+    def run(self):
+        try:
+            self.sd.get_similarity_index().refresh()
+        except Exception as error:
+            self.error = error_message(error, self.sd.discogs_user_token)
+            self.index_failed.emit(self.error)
+            return
+        self.index_ready.emit()
+
+
+class SearchWorker(QObject):
+    results_ready = pyqtSignal(str, object)
+
+    def __init__(self, sd, parent=None):
+        super().__init__(parent)
+        self.sd = sd
+        self.pending = None
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.worker = threading.Thread(target=self.run, name='search', daemon=True)
+        self.worker.start()
+
+    def search(self, text):
+        with self.condition:
+            self.pending = text
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.worker.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                text, self.pending = self.pending, None
+            try:
+                songs = self.sd.search(text)['songs']
+            except Exception:
+                songs = []
+            self.results_ready.emit(text, songs)
+
+
+class ImageLoader(QObject):
+    image_ready = pyqtSignal(str)
+    image_loaded = pyqtSignal(str, QImage)
+
+    def __init__(self, sd, icon_size=32, max_pixmaps=256, max_pending=64, workers=4, parent=None):
+        super().__init__(parent)
+        self.sd = sd
+        self.icon_size = icon_size
+        self.max_pixmaps = max_pixmaps
+        self.max_pending = max_pending
+        self.pixmaps = OrderedDict()
+        self.pending = deque()
+        self.requested = set()
+        self.failed = set()
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.image_loaded.connect(self.store_pixmap)
+        self.workers = [threading.Thread(target=self.run, name='image-loader', daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def pixmap(self, url):
+        if not url or url in self.failed:
+            return None
+        if url in self.pixmaps:
+            self.pixmaps.move_to_end(url)
+            return self.pixmaps[url]
+        self.request(url)
+        return None
+
+    def request(self, url):
+        with self.condition:
+            if url in self.requested:
+                if url in self.pending:
+                    self.pending.remove(url)
+                    self.pending.append(url)
+                return
+            self.requested.add(url)
+            self.pending.append(url)
+            while len(self.pending) > self.max_pending:
+                self.requested.discard(self.pending.popleft())
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                url = self.pending.pop()
+            image = QImage()
+            try:
+                data = self.sd.get_image(url)
+            except Exception:
+                data = None
+            if data is not None and image.loadFromData(data):
+                image = image.scaled(self.icon_size, self.icon_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self.image_loaded.emit(url, image)
+
+    def store_pixmap(self, url, image):
+        with self.condition:
+            self.requested.discard(url)
+        if image.isNull():
+            self.failed.add(url)
+            return
+        self.pixmaps[url] = QPixmap.fromImage(image)
+        while len(self.pixmaps) > self.max_pixmaps:
+            self.pixmaps.popitem(last=False)
+        self.image_ready.emit(url)
@@ -0,0 +1,169 @@
+import argparse
+import json
+import random
+import sys
+from os import path
+
+from metrics import registry, run_profiled, write_from_env
+from simple_discogs import SimpleDiscogs
+from tape_export import EXPORTERS, export_all_tapes, export_tape
+from tape_solver import TAPE_LENGTHS, fit_tape
+
+
+def open_discogs(args):
+    with open(args.config, 'r') as config_file:
+        creds = json.loads(config_file.read())
+    options = {'api_url': args.api_url} if args.api_url else {}
+    return SimpleDiscogs(creds['discogs_user_id'], creds['discogs_user_token'], user_agent='MixedTaper/1.0',
+                         database_location=args.database_location, update_on_init=False, **options)
+
+
+def command_sync(sd, args):
+    added = sd.update_releases(full=True if args.full else None)
+    print('Added ' + str(added) + ' release(s).')
+
+
+def command_hydrate(sd, args):
+    def progress(completed, total):
+        if completed % 50 == 0 or completed == total:
+            print('\r' + str(completed) + '/' + str(total), end='', file=sys.stderr, flush=True)
+
+    hydrated = sd.hydrate_track_lists(progress_callback=None if args.quiet else progress)
+    if not args.quiet:
+        print(file=sys.stderr)
+    print('Downloaded ' + str(hydrated) + ' track list(s).')
+
+
+def command_search(sd, args):
+    results = sd.search(args.text, limit=args.limit)
+    if args.releases:
+        for release in results['releases']:
+            print('\t'.join([str(release['RELEASE_ID']), str(release['YEAR']), release['ARTIST'] or '', release['TITLE'] or '']))
+    else:
+        for song in results['songs']:
+            print('\t'.join([song['LENGTH'] or '', song['ARTIST'] or '', song['TITLE'] or '', song['RELEASE'] or '']))
+
+
+def track_pool(sd, args):
+    if args.search:
+        return sd.search(args.search, limit=args.pool_size, candidate_limit=max(args.pool_size, 200))['songs']
+    return sd.query_songs(title=args.title, release=args.release, artist=args.artist,
+                          max_length=args.max_length, min_length=args.min_length)
+
+
+def command_fit(sd, args):
+    pool = track_pool(sd, args)
+    if args.shuffle:
+        random.Random(args.seed).shuffle(pool)
+    for number in range(1, args.count + 1):
+        fit = fit_tape(pool, args.tape, max_per_artist=args.max_per_artist, keep_album_order=args.album_order)
+        if not fit['sides']['A'] and not fit['sides']['B']:
+            print('No tracks left to fill tape ' + str(number) + '.', file=sys.stderr)
+            return 1
+        tape = {'NAME': args.name.format(number=number), 'TAPE_LENGTH': args.tape, 'SIDES': fit['sides']}
+        if args.save:
+            sd.save_tape(tape['NAME'], tape['SIDES'], tape['TAPE_LENGTH'])
+        if args.directory:
+            export_tape(tape, path.join(args.directory, tape['NAME'] + '.' + args.format), args.format)
+        elif not args.save:
+            EXPORTERS[args.format](tape, sys.stdout)
+        print(tape['NAME'] + ': dead air ' + sd.seconds_to_time(fit['dead_air']), file=sys.stderr)
+        pool = fit['unused']
+    return 0
+
+
+def command_export(sd, args):
+    if args.tape:
+        tapes = [tape for tape in sd.list_tapes() if tape['NAME'] == args.tape]
+        if not tapes:
+            print('No saved tape named ' + args.tape + '.', file=sys.stderr)
+            return 1
+        tape = sd.load_tape(tapes[0]['TAPE_ID'])
+        if args.directory:
+            print(export_tape(tape, path.join(args.directory, tape['NAME'] + '.' + args.format), args.format))
+        else:
+            EXPORTERS[args.format](tape, sys.stdout)
+        return 0
+    for filename in export_all_tapes(sd, args.directory or '.', args.format):
+        print(filename)
+    return 0
+
+
+def command_snapshot(sd, args):
+    if args.action == 'export':
+        info = sd.export_snapshot(args.file)
+        print('Exported ' + ', '.join(str(count) + ' ' + table for table, count in info['tables'].items()) + ' to ' + args.file + '.')
+    else:
+        info = sd.import_snapshot(args.file)
+        print(info['mode'].capitalize() + 'd ' + str(info['releases']) + ' release(s), ' + str(info['track_lists']) + ' track list(s) and ' +
+              str(info['songs']) + ' track(s) from ' + args.file + '.')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='mixedtaper', description='Build cassette track lists from a Discogs collection.')
+    parser.add_argument('--config', default='./simple_discogs.conf', help='JSON file with discogs_user_id and discogs_user_token')
+    parser.add_argument('--database-location', default=None, help='directory holding simple_discogs.sqlite')
+    parser.add_argument('--metrics', default=None, help='write metrics to this file, as Prometheus text for .prom and JSON otherwise')
+    parser.add_argument('--api-url', default=None, help='Discogs API address, for testing against discogs_stub.py')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    sync = commands.add_parser('sync', help='download new releases from the collection')
+    sync.add_argument('--full', action='store_true', help='check the whole collection for removed or moved releases')
+    sync.set_defaults(handler=command_sync)
+
+    hydrate = commands.add_parser('hydrate', help='download every missing track list')
+    hydrate.add_argument('--quiet', action='store_true')
+    hydrate.set_defaults(handler=command_hydrate)
+
+    search = commands.add_parser('search', help='search downloaded tracks')
+    search.add_argument('text')
+    search.add_argument('--limit', type=int, default=50)
+    search.add_argument('--releases', action='store_true', help='search releases instead of tracks')
+    search.set_defaults(handler=command_search)
+
+    fit = commands.add_parser('fit', help='fill both sides of a tape from the downloaded tracks')
+    fit.add_argument('--tape', default='C60', help='tape length: ' + ', '.join(TAPE_LENGTHS) + ' or C<minutes>')
+    fit.add_argument('--search', help='use the tracks matching this search as the pool')
+    fit.add_argument('--pool-size', type=int, default=500, help='number of search results to use as the pool')
+    fit.add_argument('--artist')
+    fit.add_argument('--title')
+    fit.add_argument('--release')
+    fit.add_argument('--min-length', help='shortest track to use, as M:SS')
+    fit.add_argument('--max-length', help='longest track to use, as M:SS')
+    fit.add_argument('--max-per-artist', type=int)
+    fit.add_argument('--album-order', action='store_true', help='keep tracks from the same release in album order')
+    fit.add_argument('--shuffle', action='store_true')
+    fit.add_argument('--seed', type=int)
+    fit.add_argument('--count', type=int, default=1, help='number of tapes to build, without reusing tracks')
+    fit.add_argument('--name', default='Tape {number}', help='tape name, {number} is replaced by the tape number')
+    fit.add_argument('--save', action='store_true', help='store the tapes in the database')
+    fit.add_argument('--directory', help='write each tape to this directory instead of standard output')
+    fit.add_argument('--format', choices=sorted(EXPORTERS), default='txt')
+    fit.set_defaults(handler=command_fit)
+
+    export = commands.add_parser('export', help='export saved tapes')
+    export.add_argument('--tape', help='name of the tape to export, all tapes if omitted')
+    export.add_argument('--directory', help='output directory, standard output for a single tape if omitted')
+    export.add_argument('--format', choices=sorted(EXPORTERS), default='csv')
+    export.set_defaults(handler=command_export)
+
+    snapshot = commands.add_parser('snapshot', help='export or import a compressed copy of the local library')
+    snapshot.add_argument('action', choices=['export', 'import'])
+    snapshot.add_argument('file')
+    snapshot.set_defaults(handler=command_snapshot)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    with open_discogs(args) as sd:
+        exit_code = run_profiled(args.handler, sd, args) or 0
+    if args.metrics:
+        registry.write(args.metrics)
+    else:
+        write_from_env(registry)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+from array import array
+
+from simple_discogs import SimpleDiscogs
+
+
+class Playlist:
+    track_keys = ['SONG_ID', 'RELEASE', 'ARTIST', 'DISCOGS_RELEASE_TRACK', 'LENGTH', 'TITLE', 'SECONDS']
+
+    def __init__(self, tracks=()):
+        self.song_ids = array('q')
+        self.seconds = array('l')
+        self.tracks = []
+        self.total_seconds = 0
+        self.insert(0, tracks)
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __getitem__(self, row):
+        return self.tracks[row]
+
+    def __iter__(self):
+        return iter(self.tracks)
+
+    def make_track(self, track):
+        track = {key: track.get(key) for key in self.track_keys}
+        if track['SECONDS'] is None:
+            track['SECONDS'] = SimpleDiscogs.time_to_seconds(track['LENGTH'] or '')
+        return track
+
+    def insert(self, row, tracks):
+        tracks = [self.make_track(track) for track in tracks]
+        seconds = array('l', [track['SECONDS'] or 0 for track in tracks])
+        self.song_ids[row:row] = array('q', [track['SONG_ID'] or 0 for track in tracks])
+        self.seconds[row:row] = seconds
+        self.tracks[row:row] = tracks
+        self.total_seconds += sum(seconds)
+        return len(tracks)
+
+    def append(self, track):
+        return self.insert(len(self.tracks), [track])
+
+    def remove(self, row, count=1):
+        self.total_seconds -= sum(self.seconds[row:row + count])
+        del self.song_ids[row:row + count]
+        del self.seconds[row:row + count]
+        del self.tracks[row:row + count]
+
+    def set_length(self, row, length):
+        seconds = SimpleDiscogs.time_to_seconds(length or '')
+        self.tracks[row]['LENGTH'] = length
+        self.tracks[row]['SECONDS'] = seconds
+        self.total_seconds += (seconds or 0) - self.seconds[row]
+        self.seconds[row] = seconds or 0
+
+    def clear(self):
+        self.remove(0, len(self.tracks))
+
+    def total_time(self):
+        return SimpleDiscogs.seconds_to_time(self.total_seconds)
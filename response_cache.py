@@ -0,0 +1,111 @@
+import sqlite3
+import threading
+import zlib
+from time import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class ResponseCache:
+    def __init__(self, database_file, ttl=7 * 24 * 3600, max_bytes=100 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(database_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS RESPONSES (URL TEXT PRIMARY KEY, ETAG TEXT, LAST_MODIFIED TEXT, '
+                          'CONTENT_TYPE TEXT, BODY BLOB, SIZE INTEGER, FETCHED REAL, ACCESSED REAL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS RESPONSES_ACCESSED_INDEX ON RESPONSES (ACCESSED)')
+        self.conn.commit()
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(SIZE), 0) FROM RESPONSES').fetchone()[0]
+        if self.total_bytes > self.max_bytes:
+            self.evict(self.max_bytes * 9 // 10)
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def cache_key(self, url):
+        parts = urlsplit(url)
+        query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query) if key != 'token'))
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+    def lookup(self, url):
+        with self.lock:
+            row = self.conn.execute('SELECT ETAG, LAST_MODIFIED, CONTENT_TYPE, BODY, FETCHED FROM RESPONSES WHERE URL = ?',
+                                    (self.cache_key(url), )).fetchone()
+        if row is None:
+            return None
+        return dict(zip(['ETAG', 'LAST_MODIFIED', 'CONTENT_TYPE', 'BODY', 'FETCHED'], row))
+
+    def is_fresh(self, entry, max_age=None):
+        max_age = self.ttl if max_age is None else max_age
+        return time() - entry['FETCHED'] < max_age
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry['ETAG']:
+            headers['If-None-Match'] = entry['ETAG']
+        if entry['LAST_MODIFIED']:
+            headers['If-Modified-Since'] = entry['LAST_MODIFIED']
+        return headers
+
+    def touch(self, url, refreshed=False):
+        now = time()
+        with self.lock:
+            if refreshed:
+                self.revalidated += 1
+                self.conn.execute('UPDATE RESPONSES SET FETCHED = ?, ACCESSED = ? WHERE URL = ?', (now, now, self.cache_key(url)))
+            else:
+                self.hits += 1
+                self.conn.execute('UPDATE RESPONSES SET ACCESSED = ? WHERE URL = ?', (now, self.cache_key(url)))
+            self.conn.commit()
+
+    def store(self, url, response):
+        body = zlib.compress(response.content)
+        key = self.cache_key(url)
+        now = time()
+        with self.lock:
+            self.misses += 1
+            previous = self.conn.execute('SELECT SIZE FROM RESPONSES WHERE URL = ?', (key, )).fetchone()
+            self.conn.execute('INSERT OR REPLACE INTO RESPONSES (URL, ETAG, LAST_MODIFIED, CONTENT_TYPE, BODY, SIZE, FETCHED, ACCESSED) '
+                              'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                              (key, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                               response.headers.get('Content-Type'), body, len(body), now, now))
+            self.total_bytes += len(body) - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self.evict(self.max_bytes * 9 // 10)
+            self.conn.commit()
+
+    def evict(self, target_bytes):
+        removed = []
+        for url, size in self.conn.execute('SELECT URL, SIZE FROM RESPONSES ORDER BY ACCESSED').fetchall():
+            if self.total_bytes <= target_bytes:
+                break
+            removed.append((url, ))
+            self.total_bytes -= size
+        self.conn.executemany('DELETE FROM RESPONSES WHERE URL = ?', removed)
+        return len(removed)
+
+    def make_response(self, url, entry):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.encoding = 'utf-8'
+        response._content = zlib.decompress(entry['BODY'])
+        response.headers = CaseInsensitiveDict({'Content-Type': entry['CONTENT_TYPE'] or 'application/json'})
+        response.from_cache = True
+        return response
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM RESPONSES')
+            self.conn.commit()
+            self.total_bytes = 0
@@ -0,0 +1,180 @@
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from tape_solver import fill_side
+
+FEATURE_WEIGHTS = {'GENRE': 0.5, 'STYLE': 1.0, 'LABEL': 0.8, 'DECADE': 0.4}
+
+
+class SimilarityIndex:
+    def __init__(self, sd, year_weight=0.2, year_scale=4.0, same_release_weight=0.5):
+        if np is None:
+            raise RuntimeError('Track suggestions need numpy: pip install numpy')
+        self.sd = sd
+        self.year_weight = year_weight
+        self.year_scale = year_scale
+        self.same_release_weight = same_release_weight
+        self.lock = threading.Lock()
+        self.ready = False
+        self.features = {}
+        self.feature_categories = []
+        self.clear()
+
+    def clear(self):
+        self.features.clear()
+        self.feature_categories = []
+        self.release_ids = np.zeros(0, dtype=np.int64)
+        self.years = np.zeros(0, dtype=np.int32)
+        self.posting_rows = np.zeros(0, dtype=np.int32)
+        self.posting_features = np.zeros(0, dtype=np.int32)
+        self.song_ids = np.zeros(0, dtype=np.int64)
+        self.song_rows = np.zeros(0, dtype=np.int32)
+        self.song_seconds = np.zeros(0, dtype=np.int32)
+        self.last_song_id = 0
+        self.update_weights()
+
+    def fetch(self, statement, values=()):
+        conn, cursor = self.sd.connect_to_database()
+        with self.sd.db_lock:
+            cursor.execute(statement, values)
+            return cursor.fetchall()
+
+    def release_rows(self, release_ids):
+        if not len(self.release_ids):
+            return np.full(len(release_ids), -1, dtype=np.int32)
+        order = np.argsort(self.release_ids)
+        sorted_ids = self.release_ids[order]
+        positions = np.minimum(np.searchsorted(sorted_ids, release_ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[positions] == release_ids, order[positions], -1).astype(np.int32)
+
+    def feature_id(self, category, name):
+        key = (category, name)
+        if key not in self.features:
+            self.features[key] = len(self.features)
+            self.feature_categories.append(category)
+        return self.features[key]
+
+    def refresh(self):
+        with self.lock:
+            return self.update()
+
+    def update(self):
+        rows = self.fetch('SELECT RELEASE_ID, YEAR, DECADE FROM RELEASES')
+        current = set(row[0] for row in rows)
+        known = set(self.release_ids.tolist())
+        if known - current:
+            self.ready = False
+            self.clear()
+            known = set()
+        added = [row for row in rows if row[0] not in known]
+        if added:
+            self.add_releases(added)
+        songs = self.add_songs()
+        self.ready = True
+        return len(added), songs
+
+    def is_available(self):
+        return self.ready and not self.lock.locked()
+
+    def add_releases(self, releases):
+        first_row = len(self.release_ids)
+        self.release_ids = np.concatenate([self.release_ids, np.array([row[0] for row in releases], dtype=np.int64)])
+        self.years = np.concatenate([self.years, np.array([row[1] or 0 for row in releases], dtype=np.int32)])
+        new_rows = {release_id: first_row + offset for offset, (release_id, year, decade) in enumerate(releases)}
+        postings = [(new_rows[release_id], self.feature_id('DECADE', decade)) for release_id, year, decade in releases if decade]
+        for category in ['GENRE', 'STYLE', 'LABEL']:
+            table = self.sd.release_links[category]
+            if len(new_rows) == len(self.release_ids):
+                links = self.fetch(f'SELECT RELEASE_ID, NAME FROM {table}')
+            else:
+                links = []
+                release_ids = list(new_rows)
+                for start in range(0, len(release_ids), 500):
+                    chunk = release_ids[start:start + 500]
+                    links += self.fetch(f'SELECT RELEASE_ID, NAME FROM {table} WHERE RELEASE_ID IN ({",".join("?" * len(chunk))})', chunk)
+            postings += [(new_rows[release_id], self.feature_id(category, name.lower())) for release_id, name in links
+                         if release_id in new_rows]
+        if postings:
+            postings = np.array(postings, dtype=np.int32)
+            self.posting_rows = np.concatenate([self.posting_rows, postings[:, 0]])
+            self.posting_features = np.concatenate([self.posting_features, postings[:, 1]])
+        self.update_weights()
+
+    def add_songs(self):
+        songs = self.fetch('SELECT SONG_ID, DISCOGS_RELEASE_ID, SECONDS FROM SONGS WHERE SONG_ID > ? ORDER BY SONG_ID', (self.last_song_id, ))
+        if not songs:
+            return 0
+        songs = np.array([(song_id, release_id or 0, seconds or 0) for song_id, release_id, seconds in songs], dtype=np.int64)
+        self.song_ids = np.concatenate([self.song_ids, songs[:, 0]])
+        self.song_rows = np.concatenate([self.song_rows, self.release_rows(songs[:, 1])])
+        self.song_seconds = np.concatenate([self.song_seconds, songs[:, 2].astype(np.int32)])
+        self.last_song_id = int(songs[-1, 0])
+        return len(songs)
+
+    def update_weights(self):
+        release_count = max(len(self.release_ids), 1)
+        document_counts = np.bincount(self.posting_features, minlength=len(self.features))
+        category_weights = np.array([FEATURE_WEIGHTS[category] for category in self.feature_categories], dtype=np.float64)
+        self.feature_weights = (category_weights * np.log1p(release_count / np.maximum(document_counts, 1))).astype(np.float32)
+        self.posting_weights = self.feature_weights[self.posting_features]
+        norms = np.sqrt(np.bincount(self.posting_rows, self.posting_weights.astype(np.float64) ** 2, minlength=len(self.release_ids)))
+        self.inverse_norms = np.where(norms > 0, 1 / np.maximum(norms, 1e-12), 0).astype(np.float32)
+        order = np.argsort(self.posting_features, kind='stable')
+        self.postings = self.posting_rows[order]
+        self.posting_offsets = np.searchsorted(self.posting_features[order], np.arange(len(self.features) + 1))
+
+    def release_scores(self, seed_row):
+        features = self.posting_features[self.posting_rows == seed_row]
+        rows = np.concatenate([self.postings[self.posting_offsets[feature]:self.posting_offsets[feature + 1]] for feature in features] or
+                              [np.zeros(0, dtype=np.int32)])
+        weights = np.repeat(self.feature_weights[features] ** 2, np.diff(self.posting_offsets)[features])
+        scores = np.bincount(rows, weights * self.inverse_norms[rows], minlength=len(self.release_ids)) * self.inverse_norms[seed_row]
+        if self.years[seed_row]:
+            proximity = np.exp(-np.abs(self.years - self.years[seed_row]) / self.year_scale)
+            scores = (1 - self.year_weight) * scores + self.year_weight * np.where(self.years > 0, proximity, 0)
+        scores[seed_row] *= self.same_release_weight
+        return np.append(scores, 0).astype(np.float32)
+
+    def song_positions(self, song_ids):
+        song_ids = np.array([song_id for song_id in song_ids if song_id is not None], dtype=np.int64)
+        if not len(self.song_ids):
+            return song_ids[:0]
+        positions = np.minimum(np.searchsorted(self.song_ids, song_ids), len(self.song_ids) - 1)
+        return positions[self.song_ids[positions] == song_ids]
+
+    def rank(self, song_id, remaining_seconds, exclude=(), limit=20):
+        with self.lock:
+            if len(self.release_ids):
+                self.add_songs()
+            else:
+                self.update()
+            seed = self.song_positions([song_id])
+            if not len(seed) or self.song_rows[seed[0]] < 0 or remaining_seconds <= 0:
+                return []
+            scores = self.release_scores(self.song_rows[seed[0]])[self.song_rows]
+            scores[(self.song_seconds <= 0) | (self.song_seconds > remaining_seconds)] = -1
+            scores[self.song_positions(set(exclude) | {song_id})] = -1
+            candidate_count = min(limit * 10, len(scores))
+            candidates = np.argpartition(-scores, candidate_count - 1)[:candidate_count]
+            candidates = candidates[np.lexsort((self.song_ids[candidates], -scores[candidates]))]
+            ranked = []
+            releases = set()
+            for position in candidates.tolist():
+                if scores[position] <= 0 or len(ranked) == limit:
+                    break
+                if self.song_rows[position] not in releases:
+                    releases.add(self.song_rows[position])
+                    ranked.append((int(self.song_ids[position]), float(scores[position]), int(self.song_seconds[position])))
+            return ranked
+
+    def suggest(self, song_id, remaining_seconds, exclude=(), limit=20):
+        return [(suggested_id, score) for suggested_id, score, seconds in self.rank(song_id, remaining_seconds, exclude, limit)]
+
+    def fill(self, song_id, remaining_seconds, exclude=(), candidates=100):
+        ranked = self.rank(song_id, remaining_seconds, exclude, candidates)
+        chosen, total = fill_side([seconds for suggested_id, score, seconds in ranked], remaining_seconds)
+        return [ranked[index][:2] for index in chosen]
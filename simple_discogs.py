@@ -1,25 +1,114 @@
 import requests
+import os
 import pathlib
+import re
 import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import as_completed
+from datetime import datetime, timedelta
 from os import path
+from requests.adapters import HTTPAdapter
 from sqlite3.dbapi2 import DatabaseError
-from time import sleep
+from discogs_scheduler import FetchScheduler, RateLimiter
+from image_cache import ImageCache
+from library_snapshot import SnapshotError, read_snapshot, write_snapshot
+from metrics import MeteredConnection, registry
+from response_cache import ResponseCache
+from similarity_index import SimilarityIndex
 
 class SimpleDiscogs:
-    def __init__(self, discogs_user_id, discogs_user_token, user_agent='SimpleDiscogs/0.2', database_location=None):
+    def __init__(self, discogs_user_id, discogs_user_token, user_agent='SimpleDiscogs/0.2', database_location=None,
+                 api_url='https://api.discogs.com', pool_size=10, max_workers=4, rate_window=60, reconcile_days=7,
+                 cache_ttl=7 * 24 * 3600, cache_size=100 * 1024 * 1024, metrics=registry, update_on_init=True):
         self.discogs_user_id = discogs_user_id
         self.discogs_user_token = discogs_user_token
         self.discogs_headers = {'User-Agent': user_agent}
-        self.user_releases_url = 'https://api.discogs.com/users/' + self.discogs_user_id 
+        self.api_url = api_url
+        self.reconcile_days = reconcile_days
+        self.metrics = metrics
+        self.user_releases_url = self.api_url + '/users/' + self.discogs_user_id 
         self.user_releases_url += '/collection/folders/0/releases?token=' + self.discogs_user_token
         self.release_fields = ['RELEASE_ID', 'FOLDER_ID', 'CATALOG_ID', 'ARTISTS_ID', 'DATE_ADDED', 'YEAR', 'DECADE', 'ARTIST',
                                'TITLE', 'LABEL', 'FORMAT', 'GENRE', 'STYLE', 'RELEASE_URL', 'MASTER_URL', 'THUMB_URL', 'COVER_URL']
-        self.song_fields = ['SONG_ID', 'TITLE', 'RELEASE', 'ARTIST', 'LENGTH', 'DISCOGS_RELEASE_ID', 'DISCOGS_RELEASE_TRACK']
+        self.song_fields = ['SONG_ID', 'TITLE', 'RELEASE', 'ARTIST', 'LENGTH', 'DISCOGS_RELEASE_ID', 'DISCOGS_RELEASE_TRACK', 'SECONDS']
+        self.release_field_types = {'RELEASE_ID': 'INTEGER PRIMARY KEY', 'FOLDER_ID': 'INTEGER', 'CATALOG_ID': 'TEXT', 'ARTISTS_ID': 'TEXT',
+                                    'DATE_ADDED': 'DATETIME', 'YEAR': 'INTEGER', 'DECADE': 'INTEGER', 'ARTIST': 'TEXT', 'TITLE': 'TEXT',
+                                    'LABEL': 'TEXT', 'FORMAT': 'TEXT', 'GENRE': 'TEXT', 'STYLE': 'TEXT', 'RELEASE_URL': 'TEXT',
+                                    'MASTER_URL': 'TEXT', 'THUMB_URL': 'TEXT', 'COVER_URL': 'TEXT'}
+        self.song_field_types = {'SONG_ID': 'INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL', 'TITLE': 'TEXT', 'RELEASE': 'TEXT', 'ARTIST': 'TEXT',
+                                 'LENGTH': 'TEXT', 'DISCOGS_RELEASE_ID': 'INTEGER', 'DISCOGS_RELEASE_TRACK': 'TEXT',
+                                 'SECONDS': 'INTEGER'}
+        self.tape_fields = ['TAPE_ID', 'NAME', 'TAPE_LENGTH', 'CREATED', 'UPDATED']
+        self.tape_track_fields = ['SONG_ID', 'RELEASE', 'ARTIST', 'DISCOGS_RELEASE_TRACK', 'LENGTH', 'TITLE', 'SECONDS']
+        self.release_links = {'ARTIST': 'RELEASE_ARTISTS', 'GENRE': 'RELEASE_GENRES', 'STYLE': 'RELEASE_STYLES', 'LABEL': 'RELEASE_LABELS'}
+        self.facet_fields = [field for field in self.release_fields if 'ID' not in field and 'URL' not in field and 'DATE' not in field]
+        self.schema_migrations = [self.migrate_create_tables, self.migrate_typed_columns, self.migrate_indexes,
+                                  self.migrate_release_links, self.migrate_facet_counts, self.migrate_sync_state,
+                                  self.migrate_search_index, self.migrate_song_seconds, self.migrate_facet_name_index,
+                                  self.migrate_tapes, self.migrate_song_query_indexes]
+        self.derived_migrations = [self.migrate_indexes, self.migrate_release_links, self.migrate_facet_counts, self.migrate_sync_state,
+                                   self.migrate_search_index,
+                                   self.migrate_song_seconds, self.migrate_facet_name_index, self.migrate_tapes,
+                                   self.migrate_song_query_indexes]
+        self.song_filters = {'artist': 'SONGS.ARTIST = ? COLLATE NOCASE', 'release': 'SONGS.RELEASE = ? COLLATE NOCASE',
+                             'title': 'SONGS.TITLE LIKE ?', 'min_length': 'SONGS.SECONDS >= ?', 'max_length': 'SONGS.SECONDS <= ?',
+                             'genre': '+SONGS.DISCOGS_RELEASE_ID IN (SELECT RELEASE_ID FROM RELEASE_GENRES WHERE NAME = ?)',
+                             'style': '+SONGS.DISCOGS_RELEASE_ID IN (SELECT RELEASE_ID FROM RELEASE_STYLES WHERE NAME = ?)',
+                             'decade': '+SONGS.DISCOGS_RELEASE_ID IN (SELECT RELEASE_ID FROM RELEASES WHERE DECADE = ?)',
+                             'year': '+SONGS.DISCOGS_RELEASE_ID IN (SELECT RELEASE_ID FROM RELEASES WHERE YEAR = ?)'}
+        self.song_orders = {'SONG_ID': 'SONGS.SONG_ID', 'TITLE': 'SONGS.TITLE COLLATE NOCASE', 'ARTIST': 'SONGS.ARTIST COLLATE NOCASE',
+                            'RELEASE': 'SONGS.RELEASE COLLATE NOCASE', 'SECONDS': 'SONGS.SECONDS'}
+        self.song_query_templates = {}
+        self.search_indexes = {'SONGS_SEARCH': ('SONGS', 'SONG_ID', ['TITLE', 'ARTIST', 'RELEASE'], 'bm25(10.0, 5.0, 2.0)'),
+                               'RELEASES_SEARCH': ('RELEASES', 'RELEASE_ID', ['TITLE', 'ARTIST', 'LABEL', 'GENRE', 'STYLE'],
+                                                   'bm25(10.0, 5.0, 1.0, 1.0, 1.0)')}
         if database_location:
             self.database_file = path.join(database_location, 'simple_discogs.sqlite')
+            cache_file = path.join(database_location, 'simple_discogs_cache.sqlite')
+            self.image_directory = path.join(database_location, 'simple_discogs_images')
         else:
             self.database_file = './simple_discogs.sqlite'
-        self.update_releases()
+            cache_file = './simple_discogs_cache.sqlite'
+            self.image_directory = './simple_discogs_images'
+        self.image_cache = None
+        self.similarity_index = None
+        self.conn = None
+        self.db_lock = threading.RLock()
+        self.sync_lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers.update(self.discogs_headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.cache = ResponseCache(cache_file, ttl=cache_ttl, max_bytes=cache_size) if cache_ttl else None
+        self.scheduler = FetchScheduler(self.session, RateLimiter(window=rate_window), max_workers=max_workers, cache=self.cache,
+                                        metrics=metrics)
+        if update_on_init:
+            self.update_releases()
+        else:
+            self.connect_to_database()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self.db_lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+        self.scheduler.shutdown()
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.image_cache is not None:
+            self.image_cache.close()
+
+    def clean_date(self, date_value):
+        return date_value[:19].replace('T', ' ')
 
     def clean_time(self, time_value):
         sections = time_value.split(':')
@@ -28,180 +117,429 @@ class SimpleDiscogs:
         if len(sections) == 2:
             sections = ['00'] + sections
         return ':'.join(sections)
+
+    @staticmethod
+    def time_to_seconds(time_value):
+        if type(time_value) == int:
+            return time_value
+        try:
+            sections = [int(section) for section in str(time_value).split(':')]
+        except ValueError:
+            return None
+        seconds = 0
+        for section in sections:
+            seconds = seconds * 60 + section
+        return seconds
+
+    @staticmethod
+    def seconds_to_time(seconds):
+        seconds = int(seconds or 0)
+        return f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
         
     def connect_to_database(self):
-        try:
-            conn = sqlite3.connect(self.database_file)
-        except:
-            raise DatabaseError
-        return conn, conn.cursor()
-
-    def get_releases_from_discogs(self, known_releases=[]):
-        response = requests.get(self.user_releases_url + '&per_page=200', headers=self.discogs_headers)
-        pagination = response.json()['pagination']
-        releases = response.json()['releases']
-        calls_limit_remaining = int(response.headers['X-Discogs-Ratelimit-Remaining'])
-        if pagination['items'] > 200:
-            for page in range(2, pagination['pages'] + 1):
-                if calls_limit_remaining <=0:
-                    sleep(61)
-                response = requests.get(self.user_releases_url + '&per_page=200&page=' + str(page), headers=self.discogs_headers)
+        with self.db_lock:
+            if self.conn is None:
+                try:
+                    conn = sqlite3.connect(self.database_file, check_same_thread=False, cached_statements=256,
+                                           factory=MeteredConnection)
+                except:
+                    raise DatabaseError
+                conn.metrics = self.metrics
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                self.migrate_database(conn)
+                self.conn = conn
+            return self.conn, self.conn.cursor()
+
+    def migrate_database(self, conn):
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA user_version')
+        version = cursor.fetchone()[0]
+        for number, migration in enumerate(self.schema_migrations, 1):
+            if number <= version:
+                continue
+            cursor.execute('BEGIN')
+            try:
+                migration(cursor)
+                cursor.execute('PRAGMA user_version = ' + str(number))
+                conn.commit()
+            except:
+                conn.rollback()
+                raise
+        return len(self.schema_migrations)
+
+    def migrate_create_tables(self, cursor):
+        sql_statement = 'CREATE TABLE IF NOT EXISTS RELEASES (' + ','.join(self.release_fields) + ')'
+        sql_statement = sql_statement.replace('RELEASE_ID', 'RELEASE_ID INTEGER PRIMARY KEY')
+        sql_statement = sql_statement.replace('DATE_ADDED', 'DATE_ADDED DATETIME')
+        cursor.execute(sql_statement)
+
+        sql_statement = f'CREATE TABLE IF NOT EXISTS SONGS ({",".join(self.song_fields)})'
+        sql_statement = sql_statement.replace('SONG_ID', 'SONG_ID INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL')
+        sql_statement = sql_statement.replace('DISCOGS_RELEASE_ID', 'DISCOGS_RELEASE_ID INTEGER')
+        cursor.execute(sql_statement)
+
+        cursor.execute('CREATE TABLE IF NOT EXISTS HYDRATED_RELEASES (RELEASE_ID INTEGER PRIMARY KEY, TRACK_COUNT INTEGER, HYDRATED DATETIME)')
+
+    def migrate_typed_columns(self, cursor):
+        for table, fields, field_types in [('RELEASES', self.release_fields, self.release_field_types),
+                                           ('SONGS', self.song_fields, self.song_field_types)]:
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_UNTYPED')
+            cursor.execute(f'PRAGMA table_info({table}_UNTYPED)')
+            existing = [row[1] for row in cursor.fetchall() if row[1] in fields]
+            cursor.execute(f'CREATE TABLE {table} ({",".join(name + " " + field_types[name] for name in fields)})')
+            cursor.execute(f'INSERT INTO {table} ({",".join(existing)}) SELECT {",".join(existing)} FROM {table}_UNTYPED')
+            cursor.execute(f'DROP TABLE {table}_UNTYPED')
+
+    def migrate_indexes(self, cursor):
+        cursor.execute('CREATE INDEX IF NOT EXISTS SONGS_RELEASE_ID_INDEX ON SONGS (DISCOGS_RELEASE_ID)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS SONGS_LENGTH_INDEX ON SONGS (LENGTH)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS RELEASES_ARTIST_INDEX ON RELEASES (ARTIST COLLATE NOCASE, YEAR, TITLE COLLATE NOCASE)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS RELEASES_YEAR_INDEX ON RELEASES (YEAR, ARTIST, TITLE)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS RELEASES_DECADE_INDEX ON RELEASES (DECADE)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS RELEASES_DATE_ADDED_INDEX ON RELEASES (DATE_ADDED)')
+
+    def migrate_release_links(self, cursor):
+        for table in self.release_links.values():
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {table} (RELEASE_ID INTEGER NOT NULL, NAME TEXT NOT NULL COLLATE NOCASE, '
+                           'PRIMARY KEY (NAME, RELEASE_ID)) WITHOUT ROWID')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_RELEASE_INDEX ON {table} (RELEASE_ID)')
+        cursor.execute('SELECT RELEASE_ID, ' + ','.join(self.release_links) + ' FROM RELEASES')
+        for row in cursor.fetchall():
+            self.insert_release_links(cursor, dict(zip(['RELEASE_ID'] + list(self.release_links), row)))
+
+    def migrate_facet_counts(self, cursor):
+        cursor.execute('CREATE TABLE IF NOT EXISTS FACET_COUNTS (CATEGORY TEXT NOT NULL, NAME TEXT NOT NULL, COUNT INTEGER NOT NULL, '
+                       'PRIMARY KEY (CATEGORY, NAME)) WITHOUT ROWID')
+        cursor.execute('DELETE FROM FACET_COUNTS')
+        counts = Counter()
+        cursor.execute('SELECT ' + ','.join(self.facet_fields) + ' FROM RELEASES')
+        for row in cursor.fetchall():
+            for category, value in zip(self.facet_fields, row):
+                counts.update((category, name) for name in self.facet_entries(value))
+        cursor.executemany('INSERT INTO FACET_COUNTS (CATEGORY, NAME, COUNT) VALUES (?, ?, ?)',
+                           [(category, name, total) for (category, name), total in counts.items()])
+
+    def migrate_sync_state(self, cursor):
+        cursor.execute('CREATE TABLE IF NOT EXISTS SYNC_STATE (KEY TEXT PRIMARY KEY, VALUE TEXT)')
+
+    def migrate_search_index(self, cursor):
+        for index, (table, key, columns, rank) in self.search_indexes.items():
+            cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5({",".join(columns)}, content={table}, '
+                           f"content_rowid={key}, prefix='2 3', tokenize='unicode61 remove_diacritics 2')")
+            self.create_search_triggers(cursor, index)
+            cursor.execute(f"INSERT INTO {index} ({index}, rank) VALUES ('rank', ?)", (rank, ))
+            cursor.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+    def create_search_triggers(self, cursor, index):
+        table, key, columns = self.search_indexes[index][:3]
+        new_values = ','.join('new.' + column for column in columns)
+        old_values = ','.join('old.' + column for column in columns)
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {index}_INSERT AFTER INSERT ON {table} BEGIN '
+                       f'INSERT INTO {index} (rowid, {",".join(columns)}) VALUES (new.{key}, {new_values}); END')
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {index}_DELETE AFTER DELETE ON {table} BEGIN '
+                       f"INSERT INTO {index} ({index}, rowid, {','.join(columns)}) VALUES ('delete', old.{key}, {old_values}); END")
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {index}_UPDATE AFTER UPDATE OF {",".join(columns)} ON {table} BEGIN '
+                       f"INSERT INTO {index} ({index}, rowid, {','.join(columns)}) VALUES ('delete', old.{key}, {old_values}); "
+                       f'INSERT INTO {index} (rowid, {",".join(columns)}) VALUES (new.{key}, {new_values}); END')
+
+    def migrate_song_seconds(self, cursor):
+        for index in self.search_indexes:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {index}_UPDATE')
+            self.create_search_triggers(cursor, index)
+        cursor.execute('PRAGMA table_info(SONGS)')
+        if 'SECONDS' not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE SONGS ADD COLUMN SECONDS INTEGER')
+        cursor.execute('SELECT SONG_ID, LENGTH FROM SONGS WHERE SECONDS IS NULL')
+        cursor.executemany('UPDATE SONGS SET SECONDS = ? WHERE SONG_ID = ?',
+                           [(self.time_to_seconds(length), song_id) for song_id, length in cursor.fetchall()])
+        cursor.execute('CREATE INDEX IF NOT EXISTS SONGS_SECONDS_INDEX ON SONGS (SECONDS)')
+
+    def migrate_facet_name_index(self, cursor):
+        cursor.execute('CREATE INDEX IF NOT EXISTS FACET_COUNTS_NAME_INDEX ON FACET_COUNTS (CATEGORY, NAME COLLATE NOCASE, NAME, COUNT)')
+
+    def migrate_tapes(self, cursor):
+        cursor.execute('CREATE TABLE IF NOT EXISTS TAPES (TAPE_ID INTEGER PRIMARY KEY AUTOINCREMENT, NAME TEXT NOT NULL UNIQUE, '
+                       'TAPE_LENGTH TEXT, CREATED DATETIME, UPDATED DATETIME)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS TAPE_TRACKS (TAPE_ID INTEGER NOT NULL, SIDE TEXT NOT NULL, POSITION INTEGER NOT NULL, '
+                       'SONG_ID INTEGER, RELEASE TEXT, ARTIST TEXT, DISCOGS_RELEASE_TRACK TEXT, LENGTH TEXT, TITLE TEXT, SECONDS INTEGER, '
+                       'PRIMARY KEY (TAPE_ID, SIDE, POSITION)) WITHOUT ROWID')
+
+    def migrate_song_query_indexes(self, cursor):
+        cursor.execute('CREATE INDEX IF NOT EXISTS SONGS_ARTIST_INDEX ON SONGS (ARTIST COLLATE NOCASE)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS SONGS_RELEASE_INDEX ON SONGS (RELEASE COLLATE NOCASE)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS SONGS_TITLE_INDEX ON SONGS (TITLE COLLATE NOCASE)')
+
+    def get_sync_state(self, key, default=None):
+        conn, cursor = self.connect_to_database()
+        with self.db_lock:
+            cursor.execute('SELECT VALUE FROM SYNC_STATE WHERE KEY = ?', (key, ))
+            row = cursor.fetchone()
+        return row[0] if row else default
+
+    def set_sync_state(self, key, value):
+        conn, cursor = self.connect_to_database()
+        with self.db_lock:
+            cursor.execute('INSERT OR REPLACE INTO SYNC_STATE (KEY, VALUE) VALUES (?, ?)', (key, str(value)))
+            conn.commit()
+
+    def facet_entries(self, value):
+        if type(value) == str:
+            return value.split('|')
+        elif type(value) == int:
+            return ['unknown' if value == 0 else str(value)]
+        return []
+
+    def update_facet_counts(self, cursor, release, change=1):
+        counts = Counter((category, name) for category in self.facet_fields for name in self.facet_entries(release[category]))
+        cursor.executemany('INSERT INTO FACET_COUNTS (CATEGORY, NAME, COUNT) VALUES (?, ?, ?) '
+                           'ON CONFLICT (CATEGORY, NAME) DO UPDATE SET COUNT = COUNT + excluded.COUNT',
+                           [(category, name, total * change) for (category, name), total in counts.items()])
+        if change < 0:
+            cursor.execute('DELETE FROM FACET_COUNTS WHERE COUNT <= 0')
+
+    def insert_release_links(self, cursor, release):
+        for category, table in self.release_links.items():
+            names = set(name for name in str(release[category] or '').split('|') if name)
+            cursor.executemany(f'INSERT OR IGNORE INTO {table} (RELEASE_ID, NAME) VALUES (?, ?)',
+                               [(release['RELEASE_ID'], name) for name in names])
+
+    def api_get(self, url, max_age=None):
+        return self.scheduler.fetch(url, max_age)
+
+    def get_collection_from_discogs(self, watermark=None):
+        if watermark is None:
+            collection_page = self.api_get(self.user_releases_url + '&per_page=200', max_age=0).json()
+            releases = collection_page['releases']
+            page_urls = [self.user_releases_url + '&per_page=200&page=' + str(page)
+                         for page in range(2, collection_page['pagination']['pages'] + 1)]
+            for response in self.scheduler.map(page_urls, max_age=0):
                 releases += response.json()['releases']
-                calls_limit_remaining = int(response.headers['X-Discogs-Ratelimit-Remaining'])
-        new_releases = []
-        for release in releases:
-            if int(release['basic_information']['id']) not in known_releases:
-                master_url = 'https://api.discogs.com/masters/' + str(release['basic_information']['master_id'])
-                master_url += '?token=' + self.discogs_user_token
-                if calls_limit_remaining <=0:
-                    sleep(61)
-                response = requests.get(master_url, headers=self.discogs_headers)
-                calls_limit_remaining = int(response.headers['X-Discogs-Ratelimit-Remaining'])
-                if 'genres' in response.json():
-                    release['basic_information']['genres'] = response.json()['genres']
-                if 'styles' in response.json():
-                    release['basic_information']['styles'] = response.json()['styles']
-                if 'year' in response.json():
-                    release['basic_information']['year'] = response.json()['year']
-                new_releases.append(release)
-        return new_releases
-
-    def update_releases(self):
+            return releases
+
+        releases = []
+        page = 1
+        while True:
+            collection_page = self.api_get(self.user_releases_url + '&per_page=200&sort=added&sort_order=desc&page=' + str(page),
+                                           max_age=0).json()
+            releases += collection_page['releases']
+            if page >= collection_page['pagination']['pages'] or not releases or self.clean_date(releases[-1]['date_added']) <= watermark:
+                return releases
+            page += 1
+
+    def add_master_details(self, releases):
+        mastered_releases = [release for release in releases if release['basic_information'].get('master_id')]
+        master_urls = [self.api_url + '/masters/' + str(release['basic_information']['master_id']) + '?token=' + self.discogs_user_token
+                       for release in mastered_releases]
+        for release, response in zip(mastered_releases, self.scheduler.map(master_urls)):
+            master = response.json()
+            for key in ['genres', 'styles', 'year']:
+                if key in master:
+                    release['basic_information'][key] = master[key]
+        return releases
+
+    def select_new_releases(self, collection, known_releases):
+        new_releases = {}
+        for release in collection:
+            release_id = int(release['basic_information']['id'])
+            if release_id not in known_releases and release_id not in new_releases:
+                new_releases[release_id] = release
+        return list(new_releases.values())
+
+    def get_releases_from_discogs(self, known_releases=(), watermark=None):
+        collection = self.get_collection_from_discogs(watermark=watermark)
+        return self.add_master_details(self.select_new_releases(collection, known_releases))
+
+    def reconcile_due(self):
+        last_reconciled = self.get_sync_state('LAST_RECONCILED')
+        if last_reconciled is None:
+            return True
+        return datetime.now() - datetime.fromisoformat(last_reconciled) > timedelta(days=self.reconcile_days)
+
+    def reconcile_releases(self, cursor, collection, release_folders):
+        collection_folders = {int(release['basic_information']['id']): release['folder_id'] for release in collection}
+        removed = [release_id for release_id in release_folders if release_id not in collection_folders]
+        moved = [(folder_id, release_id) for release_id, folder_id in collection_folders.items()
+                 if release_id in release_folders and release_folders[release_id] != folder_id]
+        self.remove_releases(cursor, removed)
+        cursor.executemany('UPDATE RELEASES SET FOLDER_ID = ? WHERE RELEASE_ID = ?', moved)
+        return len(removed), len(moved)
+
+    def remove_releases(self, cursor, release_ids):
+        for release_id in release_ids:
+            cursor.execute('SELECT ' + ','.join(self.facet_fields) + ' FROM RELEASES WHERE RELEASE_ID = ?', (release_id, ))
+            row = cursor.fetchone()
+            if row is not None:
+                self.update_facet_counts(cursor, dict(zip(self.facet_fields, row)), change=-1)
+        release_ids = [(release_id, ) for release_id in release_ids]
+        for table in self.release_links.values():
+            cursor.executemany(f'DELETE FROM {table} WHERE RELEASE_ID = ?', release_ids)
+        cursor.executemany('DELETE FROM SONGS WHERE DISCOGS_RELEASE_ID = ?', release_ids)
+        cursor.executemany('DELETE FROM HYDRATED_RELEASES WHERE RELEASE_ID = ?', release_ids)
+        cursor.executemany('DELETE FROM RELEASES WHERE RELEASE_ID = ?', release_ids)
+
+    def update_releases(self, full=None):
+        with self.sync_lock:
+            added = self.sync_releases(full)
+            if self.similarity_index is not None:
+                self.similarity_index.refresh()
+            return added
+
+    def sync_releases(self, full):
         conn, cursor = self.connect_to_database()
         if conn and cursor:
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            table_list = [row[0] for row in cursor.fetchall()]
-
-            if 'RELEASES' not in table_list:
-                sql_statement = 'CREATE TABLE RELEASES (' + ','.join(self.release_fields) + ')'
-                sql_statement = sql_statement.replace('RELEASE_ID', 'RELEASE_ID INTEGER PRIMARY KEY')
-                sql_statement = sql_statement.replace('DATE_ADDED', 'DATE_ADDED DATETIME')
-                cursor.execute(sql_statement)
-                conn.commit()
+            with self.db_lock:
+                cursor.execute('SELECT RELEASE_ID, FOLDER_ID FROM RELEASES')
+                release_folders = dict(cursor.fetchall())
+                cursor.execute('SELECT MAX(DATE_ADDED) FROM RELEASES')
+                watermark = cursor.fetchone()[0]
+            if full is None:
+                full = not release_folders or self.reconcile_due()
+            collection = self.get_collection_from_discogs(watermark=None if full else watermark)
+            releases = self.add_master_details(self.select_new_releases(collection, release_folders))
 
-            if 'SONGS' not in table_list:
-                sql_statement = f'CREATE TABLE SONGS ({",".join(self.song_fields)})'
-                sql_statement = sql_statement.replace('SONG_ID', 'SONG_ID INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL')
-                sql_statement = sql_statement.replace('DISCOGS_RELEASE_ID', 'DISCOGS_RELEASE_ID INTEGER')
-                cursor.execute(sql_statement)
-                conn.commit()
+            with self.db_lock:
+                for release in releases:
+                    clean_release = {}
+                    clean_release['year'] = release['basic_information']['year']
+                    clean_release['decade'] = int(str(clean_release['year'])[:-1]+'0')
+                    clean_release['master_url'] = release['basic_information']['master_url']
+                    clean_release['id'] = release['basic_information']['id']
+                    clean_release['thumb'] = release['basic_information']['thumb']
+                    clean_release['title'] = release['basic_information']['title']
+                    clean_release['cover_image'] = release['basic_information']['cover_image']
+                    clean_release['resource_url'] = release['basic_information']['resource_url']
+                    clean_release['folder_id'] = release['folder_id']
+                    clean_release['date_added'] = release['date_added']
 
-            sql_statement = f'SELECT RELEASE_ID FROM RELEASES'
-            cursor.execute(sql_statement)
-            release_ids = [row[0] for row in cursor.fetchall()]
-            releases = self.get_releases_from_discogs(known_releases=release_ids)
-
-            for release in releases:
-                clean_release = {}
-                clean_release['year'] = release['basic_information']['year']
-                clean_release['decade'] = int(str(clean_release['year'])[:-1]+'0')
-                clean_release['master_url'] = release['basic_information']['master_url']
-                clean_release['id'] = release['basic_information']['id']
-                clean_release['thumb'] = release['basic_information']['thumb']
-                clean_release['title'] = release['basic_information']['title']
-                clean_release['cover_image'] = release['basic_information']['cover_image']
-                clean_release['resource_url'] = release['basic_information']['resource_url']
-                clean_release['folder_id'] = release['folder_id']
-                clean_release['date_added'] = release['date_added']
-
-                catalog_numbers = []
-                label_names = []
-                for label in release['basic_information']['labels']:
-                    catalog_numbers.append(label['catno'])
-                    label_names.append(label['name'])
-                clean_release['catalog'] = '|'.join(list(set(catalog_numbers)))
-                clean_release['labels'] = '|'.join(list(set(label_names)))
-
-                artists = []
-                artists_ids = []
-                for artist in release['basic_information']['artists']:
-                    artists.append(artist['name'])
-                    artists_ids.append(str(artist['id']))
-                clean_release['artists'] = '|'.join(list(set(artists)))
-                clean_release['artists_ids'] = '|'.join(artists_ids)
-
-                clean_release['genres'] = '|'.join([genre for genre in release['basic_information']['genres']])
-                clean_release['styles'] = '|'.join([style for style in release['basic_information']['styles']])
-
-                formats = []
-                for release_format in release['basic_information']['formats']:
-                    formats.append(release_format['name'])
-                    if 'descriptions' in release_format:
-                        for description in release_format['descriptions']:
-                            formats.append(description)
-                clean_release['formats'] = '|'.join(list(set(formats)))
-
-                for key, value in clean_release.items():
-                    if value == None:
-                        clean_release[key] = ''
-                    elif type(value) == str:
-                        clean_release[key] = clean_release[key].replace('"', "''")
-
-                cursor = conn.cursor()
-                sql_statement = 'INSERT INTO RELEASES (' + ','.join(self.release_fields) +') VALUES (' + ','.join('?' * 17) + ')'
-
-                sql_values = (clean_release['id'], clean_release['folder_id'], clean_release['catalog'],
-                    clean_release['artists_ids'], clean_release['date_added'][:19].replace('T', ' '), clean_release['year'], 
-                    clean_release['decade'], clean_release['artists'], clean_release['title'], 
-                    clean_release['labels'], clean_release['formats'].lower(), clean_release['genres'].lower(), 
-                    clean_release['styles'].lower(), clean_release['resource_url'], clean_release['master_url'], 
-                    clean_release['thumb'], clean_release['cover_image'])
-
-                cursor.execute(sql_statement, sql_values)
-            conn.commit()
-            conn.close()
+                    catalog_numbers = []
+                    label_names = []
+                    for label in release['basic_information']['labels']:
+                        catalog_numbers.append(label['catno'])
+                        label_names.append(label['name'])
+                    clean_release['catalog'] = '|'.join(list(set(catalog_numbers)))
+                    clean_release['labels'] = '|'.join(list(set(label_names)))
+
+                    artists = []
+                    artists_ids = []
+                    for artist in release['basic_information']['artists']:
+                        artists.append(artist['name'])
+                        artists_ids.append(str(artist['id']))
+                    clean_release['artists'] = '|'.join(list(set(artists)))
+                    clean_release['artists_ids'] = '|'.join(artists_ids)
+
+                    clean_release['genres'] = '|'.join([genre for genre in release['basic_information']['genres']])
+                    clean_release['styles'] = '|'.join([style for style in release['basic_information']['styles']])
+
+                    formats = []
+                    for release_format in release['basic_information']['formats']:
+                        formats.append(release_format['name'])
+                        if 'descriptions' in release_format:
+                            for description in release_format['descriptions']:
+                                formats.append(description)
+                    clean_release['formats'] = '|'.join(list(set(formats)))
+
+                    for key, value in clean_release.items():
+                        if value == None:
+                            clean_release[key] = ''
+                        elif type(value) == str:
+                            clean_release[key] = clean_release[key].replace('"', "''")
+
+                    cursor = conn.cursor()
+                    sql_statement = 'INSERT INTO RELEASES (' + ','.join(self.release_fields) +') VALUES (' + ','.join('?' * 17) + ')'
+
+                    sql_values = (clean_release['id'], clean_release['folder_id'], clean_release['catalog'],
+                        clean_release['artists_ids'], self.clean_date(clean_release['date_added']), clean_release['year'], 
+                        clean_release['decade'], clean_release['artists'], clean_release['title'], 
+                        clean_release['labels'], clean_release['formats'].lower(), clean_release['genres'].lower(), 
+                        clean_release['styles'].lower(), clean_release['resource_url'], clean_release['master_url'], 
+                        clean_release['thumb'], clean_release['cover_image'])
+
+                    cursor.execute(sql_statement, sql_values)
+                    self.insert_release_links(cursor, dict(zip(self.release_fields, sql_values)))
+                    self.update_facet_counts(cursor, dict(zip(self.release_fields, sql_values)))
+                if full:
+                    self.reconcile_releases(cursor, collection, release_folders)
+                    cursor.execute('INSERT OR REPLACE INTO SYNC_STATE (KEY, VALUE) VALUES (?, ?)',
+                                   ('LAST_RECONCILED', datetime.now().isoformat()))
+                conn.commit()
             return len(releases)
         return 0
 
-    def get_release(self, release_id):
+    def select_rows(self, statement, values, fields):
         conn, cursor = self.connect_to_database()
-        if conn and cursor:
-            select_statement = 'SELECT ' + ','.join(self.release_fields) + ' FROM RELEASES WHERE RELEASE_ID=?'
-            cursor.execute(select_statement, (release_id,))
-            result_list = [{[name for name in self.release_fields][index]:element for index, element in enumerate(row)} for row in cursor.fetchall()][0]
-            conn.close()
-            return result_list
-        return None
+        with self.db_lock:
+            cursor.execute(statement, values)
+            return [dict(zip(fields, row)) for row in cursor.fetchall()]
 
-    def browse(self, category, selection=None):
+    def stream_rows(self, statement, values, fields, batch_size=500):
         conn, cursor = self.connect_to_database()
-        if conn and cursor:
-            if category == 'RANDOM' and selection is not None:
-                select_statement = 'SELECT ' + ','.join(self.release_fields) + ' FROM RELEASES ORDER BY RANDOM() LIMIT ?'
-                cursor.execute(select_statement, (selection, ))
-            elif category == 'all':
-                select_statement = 'SELECT ' + ','.join(self.release_fields) + ' FROM RELEASES '
-                select_statement += 'ORDER BY ARTIST COLLATE NOCASE ASC, YEAR ASC, TITLE COLLATE NOCASE ASC'
-                cursor.execute(select_statement)
-            elif category and selection:
-                select_statement = 'SELECT ' + ','.join(self.release_fields) + ' FROM RELEASES WHERE '
-                select_statement += category.upper() + ' LIKE ? OR '
-                select_statement += category.upper() + ' LIKE ? OR '
-                select_statement += category.upper() + ' LIKE ? OR '
-                select_statement += category.upper() + ' LIKE ? '
-                if category.upper() == 'YEAR' or category.upper() == 'DECADE':
-                    select_statement += 'COLLATE NOCASE ORDER BY YEAR ASC, ARTIST ASC, TITLE ASC'
-                else:
-                    select_statement += 'COLLATE NOCASE ORDER BY ARTIST ASC, YEAR ASC, TITLE ASC'
-                cursor.execute(select_statement, (selection, selection + '|%', '%|' + selection + '|%', '%|' + selection))
+        with self.db_lock:
+            cursor.execute(statement, values)
+            rows = cursor.fetchmany(batch_size)
+        try:
+            while rows:
+                for row in rows:
+                    yield dict(zip(fields, row))
+                with self.db_lock:
+                    rows = cursor.fetchmany(batch_size)
+        finally:
+            cursor.close()
+
+    def get_release(self, release_id):
+        select_statement = 'SELECT ' + ','.join(self.release_fields) + ' FROM RELEASES WHERE RELEASE_ID=?'
+        releases = self.select_rows(select_statement, (release_id, ), self.release_fields)
+        return releases[0] if releases else None
+
+    def browse_query(self, category, selection=None):
+        if category == 'RANDOM' and selection is not None:
+            select_statement = 'SELECT ' + ','.join(self.release_fields) + ' FROM RELEASES ORDER BY RANDOM() LIMIT ?'
+            return select_statement, (selection, )
+        elif category == 'all':
+            select_statement = 'SELECT ' + ','.join(self.release_fields) + ' FROM RELEASES '
+            select_statement += 'ORDER BY ARTIST COLLATE NOCASE ASC, YEAR ASC, TITLE COLLATE NOCASE ASC'
+            return select_statement, ()
+        elif category.upper() in self.release_links and selection:
+            table = self.release_links[category.upper()]
+            select_statement = 'SELECT ' + ','.join('RELEASES.' + field for field in self.release_fields)
+            select_statement += f' FROM {table} JOIN RELEASES ON RELEASES.RELEASE_ID = {table}.RELEASE_ID WHERE {table}.NAME = ? '
+            select_statement += 'ORDER BY RELEASES.ARTIST ASC, RELEASES.YEAR ASC, RELEASES.TITLE ASC'
+            return select_statement, (selection, )
+        elif category and selection:
+            select_statement = 'SELECT ' + ','.join(self.release_fields) + ' FROM RELEASES WHERE '
+            select_statement += category.upper() + ' LIKE ? OR '
+            select_statement += category.upper() + ' LIKE ? OR '
+            select_statement += category.upper() + ' LIKE ? OR '
+            select_statement += category.upper() + ' LIKE ? '
+            if category.upper() == 'YEAR' or category.upper() == 'DECADE':
+                select_statement += 'COLLATE NOCASE ORDER BY YEAR ASC, ARTIST ASC, TITLE ASC'
             else:
-                conn.close()
-                return []
-            result_list = [{[name for name in self.release_fields][index]:element for index, element in enumerate(row)} for row in cursor.fetchall()]
-            conn.close()
-            return result_list
-        return []
+                select_statement += 'COLLATE NOCASE ORDER BY ARTIST ASC, YEAR ASC, TITLE ASC'
+            return select_statement, (selection, selection + '|%', '%|' + selection + '|%', '%|' + selection)
+        return None, None
+
+    def browse(self, category, selection=None):
+        select_statement, values = self.browse_query(category, selection)
+        if select_statement is None:
+            return []
+        return self.select_rows(select_statement, values, self.release_fields)
+
+    def iter_browse(self, category, selection=None, batch_size=500):
+        select_statement, values = self.browse_query(category, selection)
+        if select_statement is not None:
+            yield from self.stream_rows(select_statement, values, self.release_fields, batch_size)
 
     def get_available_categories(self):
         conn, cursor = self.connect_to_database()
         if conn and cursor:
-            cursor.execute("SELECT sql FROM sqlite_master WHERE tbl_name = 'RELEASES' AND type = 'table'")
-            entry_list = []
-            for row in cursor.fetchall():
-                entry_list += row[0].split('(')[1].split(')')[0].split(',')
-            conn.close()
+            with self.db_lock:
+                cursor.execute('PRAGMA table_info(RELEASES)')
+                entry_list = [row[1] for row in cursor.fetchall()]
+                cursor.execute('SELECT CATEGORY, COUNT(*) FROM FACET_COUNTS GROUP BY CATEGORY')
+                facet_counts = dict(cursor.fetchall())
             entry_list = [entry for entry in entry_list if 'ID' not in entry and 'URL' not in entry and 'DATE' not in entry]
-            entry_list = [{'name':entry, 'count':len(self.get_unique_list(entry))} for entry in entry_list]
+            entry_list = [{'name':entry, 'count':facet_counts.get(entry, 0) if entry in self.facet_fields else len(self.get_unique_list(entry))}
+                          for entry in entry_list]
             artist_count = [entry['count'] for entry in entry_list if entry['name'] == 'ARTIST'][0]
             entry_list.append({'name':'RANDOM', 'count':artist_count})
             entry_list = sorted(entry_list, key=lambda k: k['name'].upper())
@@ -211,98 +549,434 @@ class SimpleDiscogs:
     def get_unique_list(self, category):
         conn, cursor = self.connect_to_database()
         if conn and cursor:
-            cursor.execute("SELECT " + category + " FROM RELEASES")
-            entry_list = []
-            for row in cursor.fetchall():
-                if type(row[0]) == str:
-                    for entry in row[0].split('|'):
-                        entry_list.append(entry)
-                elif type(row[0]) == int:
-                    if row[0] == 0:
-                        entry = 'unknown'
-                    else:
-                        entry = str(row[0])
-                    entry_list.append(entry)
-            conn.close()
-            entry_counts = list(set([(entry, entry_list.count(entry)) for entry in entry_list]))
+            with self.db_lock:
+                if category.upper() in self.facet_fields:
+                    cursor.execute('SELECT NAME, COUNT FROM FACET_COUNTS WHERE CATEGORY = ?', (category.upper(), ))
+                    entry_counts = cursor.fetchall()
+                else:
+                    cursor.execute("SELECT " + category + " FROM RELEASES")
+                    entry_counts = Counter(entry for row in cursor.fetchall() for entry in self.facet_entries(row[0])).items()
             entry_list = [{'name':entry, 'count':total} for entry, total in entry_counts]
             entry_list = sorted(entry_list, key=lambda k: k['name'].upper())
             return entry_list
         return []
 
+    def iter_unique_list(self, category, page_size=500):
+        if category.upper() not in self.facet_fields:
+            yield from self.get_unique_list(category)
+            return
+        conn, cursor = self.connect_to_database()
+        first_statement = 'SELECT NAME, COUNT FROM FACET_COUNTS WHERE CATEGORY = ? ORDER BY NAME COLLATE NOCASE, NAME LIMIT ?'
+        next_statement = 'SELECT NAME, COUNT FROM FACET_COUNTS WHERE CATEGORY = ? AND NAME COLLATE NOCASE >= ? '
+        next_statement += 'AND (NAME COLLATE NOCASE > ? OR NAME > ?) ORDER BY NAME COLLATE NOCASE, NAME LIMIT ?'
+        statement, values = first_statement, (category.upper(), page_size)
+        while True:
+            with self.db_lock:
+                cursor.execute(statement, values)
+                page = cursor.fetchall()
+            for entry, total in page:
+                yield {'name': entry, 'count': total}
+            if len(page) < page_size:
+                return
+            last_name = page[-1][0]
+            statement, values = next_statement, (category.upper(), last_name, last_name, last_name, page_size)
+
+    def save_tape(self, name, sides, tape_length=None):
+        conn, cursor = self.connect_to_database()
+        insert_statement = f'INSERT INTO TAPE_TRACKS (TAPE_ID, SIDE, POSITION, {",".join(self.tape_track_fields)}) '
+        insert_statement += f'VALUES ({",".join("?" * (len(self.tape_track_fields) + 3))})'
+        with self.db_lock:
+            with conn:
+                cursor.execute("INSERT INTO TAPES (NAME, TAPE_LENGTH, CREATED, UPDATED) VALUES (?, ?, datetime('now'), datetime('now')) "
+                               'ON CONFLICT (NAME) DO UPDATE SET TAPE_LENGTH = excluded.TAPE_LENGTH, UPDATED = excluded.UPDATED',
+                               (name, tape_length))
+                cursor.execute('SELECT TAPE_ID FROM TAPES WHERE NAME = ?', (name, ))
+                tape_id = cursor.fetchone()[0]
+                cursor.execute('DELETE FROM TAPE_TRACKS WHERE TAPE_ID = ?', (tape_id, ))
+                cursor.executemany(insert_statement, [(tape_id, side, position) + tuple(track.get(field) for field in self.tape_track_fields)
+                                                      for side, tracks in sides.items() for position, track in enumerate(tracks, 1)])
+        return tape_id
+
+    def load_tape(self, tape_id):
+        conn, cursor = self.connect_to_database()
+        with self.db_lock:
+            cursor.execute(f'SELECT {",".join(self.tape_fields)} FROM TAPES WHERE TAPE_ID = ?', (tape_id, ))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            tape = dict(zip(self.tape_fields, row))
+            cursor.execute(f'SELECT SIDE, {",".join(self.tape_track_fields)} FROM TAPE_TRACKS WHERE TAPE_ID = ? ORDER BY SIDE, POSITION',
+                           (tape_id, ))
+            tape['SIDES'] = {'A': [], 'B': []}
+            for row in cursor.fetchall():
+                tape['SIDES'].setdefault(row[0], []).append(dict(zip(self.tape_track_fields, row[1:])))
+        return tape
+
+    def list_tapes(self):
+        conn, cursor = self.connect_to_database()
+        select_statement = 'SELECT ' + ','.join('TAPES.' + field for field in self.tape_fields)
+        select_statement += ', COUNT(TAPE_TRACKS.POSITION), COALESCE(SUM(TAPE_TRACKS.SECONDS), 0) FROM TAPES '
+        select_statement += 'LEFT JOIN TAPE_TRACKS ON TAPE_TRACKS.TAPE_ID = TAPES.TAPE_ID GROUP BY TAPES.TAPE_ID ORDER BY TAPES.NAME COLLATE NOCASE'
+        with self.db_lock:
+            cursor.execute(select_statement)
+            return [dict(zip(self.tape_fields + ['TRACK_COUNT', 'SECONDS'], row)) for row in cursor.fetchall()]
+
+    def delete_tape(self, tape_id):
+        conn, cursor = self.connect_to_database()
+        with self.db_lock:
+            with conn:
+                cursor.execute('DELETE FROM TAPE_TRACKS WHERE TAPE_ID = ?', (tape_id, ))
+                cursor.execute('DELETE FROM TAPES WHERE TAPE_ID = ?', (tape_id, ))
+        return True
+
+    def export_snapshot(self, filename):
+        self.connect_to_database()
+        return write_snapshot(self.database_file, filename)
+
+    def import_snapshot(self, filename):
+        temporary_file = self.database_file + '.snapshot.tmp'
+        try:
+            header = read_snapshot(filename, temporary_file)
+            if header['schema_version'] > len(self.schema_migrations):
+                raise SnapshotError('Snapshot schema version ' + str(header['schema_version']) + ' is newer than this database')
+            conn, cursor = self.connect_to_database()
+            with self.db_lock:
+                cursor.execute('SELECT (SELECT COUNT(*) FROM RELEASES) + (SELECT COUNT(*) FROM SONGS) + (SELECT COUNT(*) FROM TAPES)')
+                if cursor.fetchone()[0] == 0:
+                    return dict(self.restore_snapshot(conn, temporary_file, header['schema_version']), mode='restore')
+                return dict(self.merge_snapshot(conn, cursor, temporary_file), mode='merge')
+        finally:
+            if path.exists(temporary_file):
+                os.remove(temporary_file)
+
+    def restore_snapshot(self, conn, snapshot_file, version):
+        snapshot = sqlite3.connect(snapshot_file)
+        try:
+            conn.commit()
+            snapshot.backup(conn)
+        finally:
+            snapshot.close()
+        conn.execute('PRAGMA journal_mode=WAL')
+        cursor = conn.cursor()
+        # The snapshot only carries the base tables, so build the indexes, links, facets and search index once, after the bulk copy.
+        cursor.execute('BEGIN')
+        try:
+            for migration in self.schema_migrations[:version]:
+                if migration in self.derived_migrations:
+                    migration(cursor)
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        self.migrate_database(conn)
+        cursor.execute('SELECT (SELECT COUNT(*) FROM RELEASES), (SELECT COUNT(*) FROM SONGS), (SELECT COUNT(*) FROM HYDRATED_RELEASES)')
+        return dict(zip(['releases', 'songs', 'track_lists'], cursor.fetchone()))
+
+    def merge_snapshot(self, conn, cursor, snapshot_file):
+        conn.commit()
+        cursor.execute('ATTACH DATABASE ? AS SNAPSHOT', (snapshot_file, ))
+        try:
+            with conn:
+                cursor.execute('PRAGMA SNAPSHOT.table_info(RELEASES)')
+                release_columns = [row[1] for row in cursor.fetchall() if row[1] in self.release_fields]
+                cursor.execute(f'SELECT {",".join(release_columns)} FROM SNAPSHOT.RELEASES '
+                               'WHERE RELEASE_ID NOT IN (SELECT RELEASE_ID FROM main.RELEASES)')
+                releases = [dict(dict.fromkeys(self.release_fields), **dict(zip(release_columns, row))) for row in cursor.fetchall()]
+                cursor.executemany(f'INSERT INTO RELEASES ({",".join(self.release_fields)}) VALUES ({",".join("?" * len(self.release_fields))})',
+                                   [tuple(release[field] for field in self.release_fields) for release in releases])
+                for release in releases:
+                    self.insert_release_links(cursor, release)
+                    self.update_facet_counts(cursor, release)
+
+                cursor.execute('CREATE TEMP TABLE IF NOT EXISTS MERGE_RELEASES (RELEASE_ID INTEGER PRIMARY KEY)')
+                cursor.execute('DELETE FROM temp.MERGE_RELEASES')
+                cursor.execute('INSERT INTO temp.MERGE_RELEASES SELECT RELEASE_ID FROM (SELECT RELEASE_ID FROM SNAPSHOT.HYDRATED_RELEASES '
+                               'UNION SELECT DISCOGS_RELEASE_ID FROM SNAPSHOT.SONGS WHERE DISCOGS_RELEASE_ID IS NOT NULL) '
+                               'WHERE RELEASE_ID IN (SELECT RELEASE_ID FROM main.RELEASES) '
+                               'AND RELEASE_ID NOT IN (SELECT RELEASE_ID FROM main.HYDRATED_RELEASES) '
+                               'AND RELEASE_ID NOT IN (SELECT DISCOGS_RELEASE_ID FROM main.SONGS WHERE DISCOGS_RELEASE_ID IS NOT NULL)')
+                cursor.execute('PRAGMA SNAPSHOT.table_info(SONGS)')
+                song_columns = [row[1] for row in cursor.fetchall() if row[1] in self.song_fields and row[1] != 'SONG_ID']
+                cursor.execute(f'INSERT INTO SONGS ({",".join(song_columns)}) SELECT {",".join(song_columns)} FROM SNAPSHOT.SONGS '
+                               'WHERE DISCOGS_RELEASE_ID IN (SELECT RELEASE_ID FROM temp.MERGE_RELEASES) ORDER BY SONG_ID')
+                songs = cursor.rowcount
+                cursor.execute('INSERT INTO HYDRATED_RELEASES (RELEASE_ID, TRACK_COUNT, HYDRATED) SELECT RELEASE_ID, '
+                               '(SELECT COUNT(*) FROM main.SONGS WHERE DISCOGS_RELEASE_ID = MERGE_RELEASES.RELEASE_ID), '
+                               "datetime('now') FROM temp.MERGE_RELEASES")
+                track_lists = cursor.rowcount
+                cursor.execute('SELECT SONG_ID, LENGTH FROM SONGS WHERE SECONDS IS NULL AND LENGTH IS NOT NULL')
+                cursor.executemany('UPDATE SONGS SET SECONDS = ? WHERE SONG_ID = ?',
+                                   [(self.time_to_seconds(length), song_id) for song_id, length in cursor.fetchall()])
+                cursor.execute('DELETE FROM temp.MERGE_RELEASES')
+        finally:
+            cursor.execute('DETACH DATABASE SNAPSHOT')
+        return {'releases': len(releases), 'songs': songs, 'track_lists': track_lists}
+
+    def search_query(self, text, min_prefix=2):
+        return ' '.join('"' + term + '"' + ('*' if len(term) >= min_prefix else '') for term in re.findall(r'\w+', text))
+
+    def search(self, text, limit=50, candidate_limit=200):
+        results = {'songs': [], 'releases': []}
+        query = self.search_query(text)
+        if not query:
+            return results
+        conn, cursor = self.connect_to_database()
+        with self.db_lock:
+            for name, fields, index in [('songs', self.song_fields, 'SONGS_SEARCH'), ('releases', self.release_fields, 'RELEASES_SEARCH')]:
+                table, key = self.search_indexes[index][:2]
+                select_statement = 'SELECT ' + ','.join(table + '.' + field for field in fields)
+                select_statement += f' FROM (SELECT rowid, rank FROM {index} WHERE {index} MATCH ? ORDER BY rowid DESC LIMIT ?) AS MATCHES '
+                select_statement += f'JOIN {table} ON {table}.{key} = MATCHES.rowid ORDER BY MATCHES.rank LIMIT ?'
+                cursor.execute(select_statement, (query, candidate_limit, limit))
+                results[name] = [dict(zip(fields, row)) for row in cursor.fetchall()]
+        return results
+
+    def get_image(self, image_url):
+        with self.db_lock:
+            if self.image_cache is None:
+                self.image_cache = ImageCache(self.image_directory, self.scheduler)
+        try:
+            return self.image_cache.get(image_url)
+        except requests.RequestException:
+            return None
+
+    def get_similarity_index(self):
+        with self.db_lock:
+            if self.similarity_index is None:
+                self.similarity_index = SimilarityIndex(self)
+        return self.similarity_index
+
+    def suggestion_rows(self, suggestions):
+        if not suggestions:
+            return []
+        scores = dict(suggestions)
+        songs = self.select_rows(f'SELECT {",".join(self.song_fields)} FROM SONGS WHERE SONG_ID IN ({",".join("?" * len(scores))})',
+                                 list(scores), self.song_fields)
+        songs = {song['SONG_ID']: dict(song, SCORE=round(scores[song['SONG_ID']], 3)) for song in songs}
+        return [songs[song_id] for song_id, score in suggestions if song_id in songs]
+
+    def suggest_tracks(self, song_id, remaining_seconds, exclude=(), limit=20):
+        return self.suggestion_rows(self.get_similarity_index().suggest(song_id, remaining_seconds, exclude, limit))
+
+    def fill_suggestions(self, song_id, remaining_seconds, exclude=()):
+        return self.suggestion_rows(self.get_similarity_index().fill(song_id, remaining_seconds, exclude))
+
     def get_video_list(self, release_id):
-        release_url = 'https://api.discogs.com/releases/' + str(release_id)
-        release_url += '?per_page=100&token=' + self.discogs_user_token
-        response = requests.get(release_url, headers=self.discogs_headers)
-        if 'videos' in response.json() and response.json()['videos']:
-            video_list = response.json()['videos']
-        else:
-            video_list = []
-        return video_list
+        release_url = self.api_url + '/releases/' + str(release_id)
+        release_url += '?token=' + self.discogs_user_token
+        release = self.api_get(release_url).json()
+        return release.get('videos') or []
 
     def get_track_list(self, release_id):
         tracklist = []
         songs = self.query_songs(discogs_release_id=release_id)
-        if songs == []:
-            release_url = 'https://api.discogs.com/releases/' + str(release_id)
+        if songs == [] and not self.is_hydrated(release_id):
+            release_url = self.api_url + '/releases/' + str(release_id)
             release_url += '?token=' + self.discogs_user_token
-            response = requests.get(release_url, headers=self.discogs_headers)
-            if response.json()['tracklist']:
-                tracklist = response.json()['tracklist']
-                for track in tracklist:
-                    self.insert_song(track['title'], response.json()['title'], response.json()['artists'][0]['name'], track['duration'], release_id, track['position'])
+            response = self.api_get(release_url)
+            if response.status_code == 200:
+                tracklist = self.store_track_list(release_id, response.json())
+            elif response.status_code == 404:
+                self.insert_songs(release_id, [])
+            else:
+                raise requests.HTTPError('Discogs returned ' + str(response.status_code) + ' for release ' + str(release_id),
+                                         response=response)
         else:
             tracklist = [{'position':song['DISCOGS_RELEASE_TRACK'], 'title':song['TITLE']} for song in songs]
         return tracklist
+
+    def store_track_list(self, release_id, release):
+        tracklist = [track for track in release.get('tracklist') or [] if track.get('type_') != 'heading']
+        artist = release['artists'][0]['name'] if release.get('artists') else ''
+        self.insert_songs(release_id, [(track['title'], release['title'], artist, track['duration'], release_id, track['position'])
+                                       for track in tracklist])
+        return tracklist
+
+    def is_hydrated(self, release_id):
+        conn, curs = self.connect_to_database()
+        with self.db_lock:
+            curs.execute('SELECT 1 FROM HYDRATED_RELEASES WHERE RELEASE_ID = ?', (release_id, ))
+            return curs.fetchone() is not None
+
+    def get_unhydrated_releases(self):
+        conn, curs = self.connect_to_database()
+        sql_statement = 'SELECT RELEASE_ID FROM RELEASES WHERE RELEASE_ID NOT IN (SELECT RELEASE_ID FROM HYDRATED_RELEASES) '
+        sql_statement += 'AND RELEASE_ID NOT IN (SELECT DISCOGS_RELEASE_ID FROM SONGS WHERE DISCOGS_RELEASE_ID IS NOT NULL) '
+        sql_statement += 'ORDER BY RELEASE_ID'
+        with self.db_lock:
+            curs.execute(sql_statement)
+            return [row[0] for row in curs.fetchall()]
+
+    def hydrate_track_lists(self, progress_callback=None):
+        release_ids = self.get_unhydrated_releases()
+        futures = {}
+        for release_id in release_ids:
+            release_url = self.api_url + '/releases/' + str(release_id) + '?token=' + self.discogs_user_token
+            futures[self.scheduler.submit(release_url)] = release_id
+        hydrated = 0
+        try:
+            for completed, future in enumerate(as_completed(futures), 1):
+                try:
+                    response = future.result()
+                    if response.status_code == 200:
+                        self.store_track_list(futures[future], response.json())
+                        hydrated += 1
+                    elif response.status_code == 404:
+                        self.insert_songs(futures[future], [])
+                except (requests.RequestException, ValueError):
+                    pass
+                finally:
+                    if progress_callback:
+                        progress_callback(completed, len(release_ids))
+        finally:
+            for future in futures:
+                future.cancel()
+        return hydrated
     
     def insert_song(self, title, release, artist, length, discogs_release_id, discogs_release_track):
         conn, curs = self.connect_to_database()
         sql_statement = f'INSERT INTO SONGS ({",".join(self.song_fields)}) VALUES ({",".join("?" * len(self.song_fields))})'
-        sql_values = (None, title, release, artist, self.clean_time(length), discogs_release_id, discogs_release_track)
-        curs.execute(sql_statement, sql_values)
-        conn.commit()
-        conn.close()
+        sql_values = (None, title, release, artist, self.clean_time(length), discogs_release_id, discogs_release_track,
+                      self.time_to_seconds(length))
+        with self.db_lock:
+            curs.execute(sql_statement, sql_values)
+            conn.commit()
+        return True
+    
+    def insert_songs(self, discogs_release_id, songs):
+        conn, curs = self.connect_to_database()
+        sql_statement = f'INSERT INTO SONGS ({",".join(self.song_fields)}) VALUES ({",".join("?" * len(self.song_fields))})'
+        sql_values = [(None, title, release, artist, self.clean_time(length), release_id, release_track, self.time_to_seconds(length))
+                      for title, release, artist, length, release_id, release_track in songs]
+        with self.db_lock:
+            curs.execute('SELECT 1 FROM HYDRATED_RELEASES WHERE RELEASE_ID = ? UNION ALL '
+                         'SELECT 1 FROM SONGS WHERE DISCOGS_RELEASE_ID = ? LIMIT 1', (discogs_release_id, discogs_release_id))
+            if curs.fetchone() is not None:
+                return False
+            with conn:
+                curs.executemany(sql_statement, sql_values)
+                curs.execute("INSERT OR REPLACE INTO HYDRATED_RELEASES VALUES (?, ?, datetime('now'))",
+                             (discogs_release_id, len(sql_values)))
         return True
     
     def remove_song(self, song_id):
         conn, curs = self.connect_to_database()
-        sql_statement = f'DELETE FROM SONGS WHERE SONG_ID = {song_id}'
-        curs.execute(sql_statement)
-        conn.commit()
-        conn.close()
+        sql_statement = 'DELETE FROM SONGS WHERE SONG_ID = ?'
+        with self.db_lock:
+            curs.execute(sql_statement, (song_id, ))
+            conn.commit()
         return True
 
     def get_songs(self):
-        conn, curs = self.connect_to_database()
-        sql_statement = f'SELECT {",".join(self.song_fields)} FROM SONGS'
-        curs.execute(sql_statement)
-        songs = [{[name for name in self.song_fields][index]:element for index, element in enumerate(row)} for row in curs.fetchall()]
-        conn.close()
-        return songs
+        return self.select_rows(f'SELECT {",".join(self.song_fields)} FROM SONGS', (), self.song_fields)
 
-    def query_songs(self, song_id=None, title=None, release=None, artist=None, 
-                    max_length=None, min_length=None, discogs_release_id=None, discogs_release_track=None):
-        conn, curs = self.connect_to_database()
+    def song_query(self, song_id=None, title=None, release=None, artist=None,
+                   max_length=None, min_length=None, discogs_release_id=None, discogs_release_track=None):
         sql_statement = f'SELECT {",".join(self.song_fields)} FROM SONGS WHERE '
         criteria_list = []
+        sql_values = []
         for criteria in [(title, 'TITLE'), (release, 'RELEASE'), (artist, 'ARTIST')]:
             if criteria[0]:
-                criteria_list.append(f'{criteria[1]} LIKE "%{criteria[0]}%" ')
+                criteria_list.append(f'{criteria[1]} LIKE ? ')
+                sql_values.append('%' + criteria[0] + '%')
         if max_length:
-            criteria_list.append(f'LENGTH <= "{self.clean_time(max_length)}" ')
+            criteria_list.append('SECONDS <= ? ')
+            sql_values.append(self.time_to_seconds(max_length))
         if min_length:
-            criteria_list.append(f'LENGTH >= "{self.clean_time(min_length)}" ')
+            criteria_list.append('SECONDS >= ? ')
+            sql_values.append(self.time_to_seconds(min_length))
         if song_id:
-            criteria_list.append(f'SONG_ID = {song_id} ')
+            criteria_list.append('SONG_ID = ? ')
+            sql_values.append(song_id)
         if discogs_release_id:
-            criteria_list.append(f'DISCOGS_RELEASE_ID = {discogs_release_id} ')
+            criteria_list.append('DISCOGS_RELEASE_ID = ? ')
+            sql_values.append(discogs_release_id)
         if discogs_release_track:
-            criteria_list.append(f'DISCOGS_RELEASE_ID = {discogs_release_track} ')
-        sql_statement += 'AND '.join(criteria_list)
-        curs.execute(sql_statement)
+            criteria_list.append('DISCOGS_RELEASE_TRACK = ? ')
+            sql_values.append(discogs_release_track)
+        if not criteria_list:
+            criteria_list.append('1 ')
+        return sql_statement + 'AND '.join(criteria_list), sql_values
+
+    def query_songs(self, song_id=None, title=None, release=None, artist=None, 
+                    max_length=None, min_length=None, discogs_release_id=None, discogs_release_track=None, limit=None):
+        sql_statement, sql_values = self.song_query(song_id, title, release, artist, max_length, min_length,
+                                                    discogs_release_id, discogs_release_track)
+        if limit is not None:
+            sql_statement += 'LIMIT ?'
+            sql_values.append(limit)
         try:
-            songs = [{[name for name in self.song_fields][index]:element for index, element in enumerate(row)} for row in curs.fetchall()]
-        except:
-            songs = []
-        conn.close()
-        return songs
+            return self.select_rows(sql_statement, sql_values, self.song_fields)
+        except sqlite3.Error:
+            return []
+
+    def iter_songs(self, batch_size=500, **criteria):
+        sql_statement, sql_values = self.song_query(**criteria)
+        yield from self.stream_rows(sql_statement, sql_values, self.song_fields, batch_size)
+
+    def song_query_template(self, filters, order_by, descending, keyset):
+        key = (filters, order_by, descending, keyset)
+        if key not in self.song_query_templates:
+            order = self.song_orders[order_by]
+            more = '<' if descending else '>'
+            select_statement = 'SELECT ' + ','.join('SONGS.' + field for field in self.song_fields) + ' FROM SONGS '
+            # Release filters are written as +DISCOGS_RELEASE_ID so SQLite walks the ORDER BY index and stops after one page,
+            # instead of collecting and sorting every matching song.
+            criteria_list = [self.song_filters[name] for name in filters]
+            if order_by == 'SECONDS':
+                criteria_list.append('SONGS.SECONDS IS NOT NULL')
+            # NULLs sort before every value, so a page that ends on a NULL continues with the rest of the NULLs
+            # ('NULL') and, ascending, then with the values ('VALUES'); descending, the values are followed by the NULLs ('NULLS').
+            if keyset == 'AFTER' and order_by == 'SONG_ID':
+                criteria_list.append(f'SONGS.SONG_ID {more} ?')
+            elif keyset == 'AFTER':
+                criteria_list.append(f'{order} {more}= ? AND ({order} {more} ? OR SONGS.SONG_ID {more} ?)')
+            elif keyset == 'NULL':
+                criteria_list.append(f'SONGS.{order_by} IS NULL AND SONGS.SONG_ID {more} ?')
+            elif keyset == 'NULLS':
+                criteria_list.append(f'SONGS.{order_by} IS NULL')
+            elif keyset == 'VALUES':
+                criteria_list.append(f'SONGS.{order_by} IS NOT NULL')
+            if criteria_list:
+                select_statement += 'WHERE ' + ' AND '.join(criteria_list) + ' '
+            direction = ' DESC' if descending else ''
+            select_statement += 'ORDER BY ' + order + direction
+            if order_by != 'SONG_ID':
+                select_statement += ', SONGS.SONG_ID' + direction
+            self.song_query_templates[key] = select_statement + ' LIMIT ?'
+        return self.song_query_templates[key]
+
+    def find_songs(self, artist=None, release=None, title=None, genre=None, style=None, decade=None, year=None,
+                   min_length=None, max_length=None, order_by='ARTIST', descending=False, limit=100, after=None):
+        if order_by not in self.song_orders:
+            raise ValueError('Unknown song order: ' + str(order_by))
+        criteria = {'artist': artist, 'release': release, 'title': '%' + title + '%' if title else None, 'genre': genre, 'style': style,
+                    'decade': decade, 'year': year, 'min_length': self.time_to_seconds(min_length) if min_length else None,
+                    'max_length': self.time_to_seconds(max_length) if max_length else None}
+        filters = tuple(name for name in self.song_filters if criteria[name] is not None)
+        sql_values = [criteria[name] for name in filters]
+        if after is None:
+            keysets = [(None, [])]
+        elif order_by == 'SONG_ID':
+            keysets = [('AFTER', [after[1]])]
+        elif after[0] is None:
+            keysets = [('NULL', [after[1]])] + ([] if descending else [('VALUES', [])])
+        else:
+            keysets = [('AFTER', [after[0], after[0], after[1]])] + ([('NULLS', [])] if descending and order_by != 'SECONDS' else [])
+        songs = []
+        for keyset, keyset_values in keysets:
+            select_statement = self.song_query_template(filters, order_by, descending, keyset)
+            songs += self.select_rows(select_statement, sql_values + keyset_values + [limit - len(songs)], self.song_fields)
+            if len(songs) == limit:
+                break
+        next_key = (songs[-1][order_by], songs[-1]['SONG_ID']) if len(songs) == limit else None
+        return {'songs': songs, 'next': next_key}
+
+    def iter_find_songs(self, page_size=500, **criteria):
+        after = None
+        while True:
+            page = self.find_songs(limit=page_size, after=after, **criteria)
+            yield from page['songs']
+            after = page['next']
+            if after is None:
+                return
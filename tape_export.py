@@ -0,0 +1,64 @@
+import csv
+import json
+import re
+from os import path
+
+
+def tape_tracks(tape):
+    for side in sorted(tape['SIDES']):
+        for number, track in enumerate(tape['SIDES'][side], 1):
+            yield side, number, track
+
+
+def write_txt(tape, out_file):
+    current_side = None
+    for side, number, track in tape_tracks(tape):
+        if side != current_side:
+            out_file.write('SIDE ' + side + '\n')
+            current_side = side
+        out_file.write('\t'.join(['', str(number), track['LENGTH'] or '',
+                                  (track['TITLE'] or '') + ' - ' + (track['ARTIST'] or '') + ' [' + (track['RELEASE'] or '') + ']']) + '\n')
+
+
+def write_csv(tape, out_file):
+    writer = csv.writer(out_file, lineterminator='\n')
+    writer.writerow(['SIDE', 'TRACK NO', 'TIME', 'TITLE', 'ARTIST', 'RELEASE'])
+    writer.writerows([side, number, track['LENGTH'], track['TITLE'], track['ARTIST'], track['RELEASE']]
+                     for side, number, track in tape_tracks(tape))
+
+
+def write_m3u(tape, out_file):
+    out_file.write('#EXTM3U\n')
+    out_file.write('#PLAYLIST:' + (tape.get('NAME') or '') + '\n')
+    for side, number, track in tape_tracks(tape):
+        name = (track['ARTIST'] or '') + ' - ' + (track['TITLE'] or '')
+        out_file.write('#EXTINF:' + str(track['SECONDS'] if track['SECONDS'] is not None else -1) + ',' + name + '\n')
+        out_file.write('#EXTALB:' + (track['RELEASE'] or '') + '\n')
+        out_file.write(name + '\n')
+
+
+def write_json(tape, out_file):
+    json.dump(tape, out_file, indent=2)
+
+
+EXPORTERS = {'txt': write_txt, 'csv': write_csv, 'm3u': write_m3u, 'json': write_json}
+
+
+def export_tape(tape, filename, export_format=None):
+    export_format = (export_format or path.splitext(filename)[1][1:] or 'txt').lower()
+    if export_format not in EXPORTERS:
+        raise ValueError('Unknown export format: ' + export_format)
+    with open(filename, 'w', encoding='utf-8', newline='') as out_file:
+        EXPORTERS[export_format](tape, out_file)
+    return filename
+
+
+def export_all_tapes(sd, directory, export_format='csv'):
+    filenames = []
+    for tape in sd.list_tapes():
+        name = re.sub(r'[^\w\- ]+', '_', tape['NAME']).strip() or 'tape'
+        filename = path.join(directory, name + '.' + export_format)
+        if filename in filenames:
+            filename = path.join(directory, name + '_' + str(tape['TAPE_ID']) + '.' + export_format)
+        filenames.append(export_tape(sd.load_tape(tape['TAPE_ID']), filename, export_format))
+    return filenames
@@ -0,0 +1,94 @@
+import re
+from collections import Counter
+
+TAPE_LENGTHS = {'C46': 46 * 60, 'C60': 60 * 60, 'C90': 90 * 60, 'C120': 120 * 60}
+
+
+def tape_seconds(tape):
+    if type(tape) == int:
+        return tape * 60
+    if tape.upper() in TAPE_LENGTHS:
+        return TAPE_LENGTHS[tape.upper()]
+    match = re.fullmatch(r'C?(\d+)', tape.strip(), re.IGNORECASE)
+    if match is None:
+        raise ValueError('Unknown tape length: ' + tape)
+    return int(match.group(1)) * 60
+
+
+def position_key(position):
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part.upper()) for part in re.findall(r'\d+|\D+', position or '')]
+
+
+def fill_side(weights, capacity):
+    mask = (1 << (capacity + 1)) - 1
+    target = 1 << capacity
+    reachable = [1]
+    for weight in weights:
+        current = reachable[-1]
+        if current & target:
+            break
+        reachable.append((current | current << weight) & mask if weight <= capacity else current)
+    total = reachable[-1].bit_length() - 1
+    chosen = []
+    remaining = total
+    for index in range(len(reachable) - 2, -1, -1):
+        if not reachable[index] >> remaining & 1:
+            chosen.append(index)
+            remaining -= weights[index]
+    return sorted(chosen), total
+
+
+def order_side(tracks, keep_album_order):
+    if not keep_album_order:
+        return tracks
+    release_order = {}
+    for track in tracks:
+        release_order.setdefault(track.get('DISCOGS_RELEASE_ID', track.get('RELEASE')), len(release_order))
+    return sorted(tracks, key=lambda track: (release_order[track.get('DISCOGS_RELEASE_ID', track.get('RELEASE'))],
+                                             position_key(track.get('DISCOGS_RELEASE_TRACK'))))
+
+
+def solve(pool, side_length, gap_seconds):
+    sides = []
+    for side in ['A', 'B']:
+        weights = [track['SECONDS'] + gap_seconds for track in pool]
+        chosen, total = fill_side(weights, side_length + gap_seconds)
+        sides.append([pool[index] for index in chosen])
+        chosen = set(chosen)
+        pool = [track for index, track in enumerate(pool) if index not in chosen]
+    return sides
+
+
+def fit_tape(tracks, tape='C60', max_per_artist=None, keep_album_order=False, gap_seconds=0):
+    side_length = tape_seconds(tape) // 2
+    pool = [track for track in tracks if track.get('SECONDS')]
+    while True:
+        sides = solve(pool, side_length, gap_seconds)
+        if not max_per_artist:
+            break
+        artist_counts = Counter(track['ARTIST'] for side in sides for track in side)
+        over_limit = {artist: count - max_per_artist for artist, count in artist_counts.items() if count > max_per_artist}
+        if not over_limit:
+            break
+        chosen = set(id(track) for side in sides for track in side)
+        kept = []
+        for track in pool:
+            artist = track['ARTIST']
+            if artist in over_limit:
+                if id(track) not in chosen:
+                    continue
+                if over_limit[artist] > 0:
+                    over_limit[artist] -= 1
+                    continue
+            kept.append(track)
+        pool = kept
+
+    result = {'side_length': side_length, 'sides': {}, 'totals': {}, 'dead_air': 0}
+    placed = set()
+    for side, side_tracks in zip(['A', 'B'], sides):
+        result['sides'][side] = order_side(side_tracks, keep_album_order)
+        result['totals'][side] = sum(track['SECONDS'] for track in side_tracks) + gap_seconds * max(len(side_tracks) - 1, 0)
+        result['dead_air'] += side_length - result['totals'][side]
+        placed.update(id(track) for track in side_tracks)
+    result['unused'] = [track for track in tracks if id(track) not in placed]
+    return result